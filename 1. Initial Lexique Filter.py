@@ -5,169 +5,234 @@
   2. Set paths:
     Fill in desired input and output file paths.
   3. Adjust memory:
-    a. Add memory to IDE. I gave my IDE 2 GiB. You could probably get away with less.
-    b. If having issues maybe try: read_csv(..., low_memory=false) -> read_csv(..., low_memory=true)
+    a. Only the 11 columns we keep are read, with compact dtypes, so this needs far less than the 2 GiB it used to.
+    b. If memory is still tight set read_chunk_rows to stream the .csv and filter it chunk by chunk.
 
 @Purpose: Filter lexique lemmes so that:
- 1. Rename necessary column names.
- 2. Remove unwanted columns.
+ 1. Read only the necessary columns.
+ 2. Rename them.
  3. Filter where lemme and ortho columns are both > 2 chars.
  4. Filter where cgram equals whitelisted values.
  5. Remove where dirty one off data.
- 6. Save to CSV.
+ 6. Save to CSV, plus an index of where each lemme's rows are in it (offset_index.py).
+ Steps 3-5 are rules in lexique_filter_rules.json (normalise, min_length, blocklist, whitelist),
+ so extend the blocklist there rather than in here.
 
-@Note: This is probably going to be very slow. On my machine it took ~13 minutes to run.
-        But it only needs to run once. And I'm attaching the output so you don't need to run it at all.
-
-Todo:
-    - Optimize group_dfs_by_lemme().. 54% of runtime
-    - Optimize filter_df_for_highest_pos().. 45% of runtime excluding group_dfs_by_lemme()
+@Note: This used to take ~13 minutes (iterrows() + a concat per row). filter_df_for_highest_pos() is now
+        a single grouped pass so the full Lexique runs in seconds. I'm still attaching the output so you
+        don't need to run it at all.
 """
-import warnings
+import json
+from collections import Counter
 
+import numpy as np
 import pandas as pd
 import os
-import gc
+
+from build_manifest import BuildManifest
+from instrumentation import section
+from lexique_schema import (GENRE_DTYPE, NOMBRE_DTYPE, NUMERIC_DTYPES, SCHEMA_VERSION, categorical_from_codes,
+                            first_seen_codes, pos_dtype, pos_rank_table)
+from offset_index import build_offset_index, load_offset_index
+from snapshot_cache import load_cached, snapshot_key
 
 # ==== Configuration ====
 user_path = os.path.expanduser('~')
 input_file_path = f'{user_path}/Documents/flashcard_project_new/Lexique383.csv'
 output_file_path = f'{user_path}/Documents/flashcard_project_new/Lexique383 - Filtered.csv'
+read_chunk_rows = None  # e.g. 20_000 to stream the .csv in chunks and keep peak memory down
+filter_rules_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexique_filter_rules.json')
 # ========================
 
 # Globals
-desired_POS = ['adj', 'ver', 'adv', 'ono', 'pre', 'con', 'nom', 'adj:ind']
+with open(filter_rules_path, encoding='utf-8') as rules_file:
+    filter_rules = json.load(rules_file)
+
+# whitelisted POS, in priority order
+desired_POS = filter_rules['whitelist']['cgram']
+
+# rank of each cgram code (see lexique_schema.py), anything not whitelisted ranks last
+pos_ranks = pos_rank_table(desired_POS, desired_POS)
+
+# string ops the rule set's "normalise" section can name
+normalisers = {'lower': lambda s: s.str.lower(),
+               'upper': lambda s: s.str.upper(),
+               'strip': lambda s: s.str.strip(),
+               }
+
+# the only lexique columns we read, and what we rename them to
+lexique_columns = {'1_ortho': "ortho",
+                   '2_phon': 'phon',  # pronunciation, stage 4 fetches one clip per phon
+                   '3_lemme': 'lemme',
+                   '4_cgram': 'cgram',
+                   '5_genre': "genre",
+                   '6_nombre': "nombre",
+                   '7_freqlemfilms2': 'freqlemfilms',
+                   '8_freqlemlivres': 'freqlemlivres',
+                   '14_islem': 'islem',
+                   '28_orthosyll': 'orthosyll',
+                   '29_cgramortho': 'cgramortho',
+                   }
+
+# compact dtypes assigned at parse time. genre/nombre get fixed categories so chunks concat cleanly
+lexique_dtypes = {'1_ortho': object,
+                  '2_phon': object,
+                  '3_lemme': object,
+                  '4_cgram': 'category',
+                  '5_genre': GENRE_DTYPE,
+                  '6_nombre': NOMBRE_DTYPE,
+                  '7_freqlemfilms2': NUMERIC_DTYPES['freqlemfilms'],
+                  '8_freqlemlivres': NUMERIC_DTYPES['freqlemlivres'],
+                  '14_islem': NUMERIC_DTYPES['islem'],
+                  '28_orthosyll': object,
+                  '29_cgramortho': object,
+                  }
+
 
 def main():
-    # read .csv with pandas
-    df = pd.read_csv(input_file_path, low_memory=False)
-
-    # rename desired column headers
-    df.rename(columns={'1_ortho': "ortho",
-                       '3_lemme': 'lemme',
-                       '4_cgram': 'cgram',
-                       '5_genre': "genre",
-                       '6_nombre': "nombre",
-                       '7_freqlemfilms2': 'freqlemfilms',
-                       '8_freqlemlivres': 'freqlemlivres',
-                       '14_islem': 'islem',
-                       '28_orthosyll': 'orthosyll',
-                       '29_cgramortho': 'cgramortho',
-                       }, inplace=True)
-
-    # remove unwanted columns
-    df = df.drop(columns=['2_phon',
-                          '9_freqfilms2',
-                          '10_freqlivres',
-                          '11_infover',
-                          '12_nbhomogr',
-                          '13_nbhomoph',
-                          '15_nblettres',
-                          '16_nbphons',
-                          '17_cvcv',
-                          '18_p_cvcv',
-                          '19_voisorth',
-                          '20_voisphon',
-                          '21_puorth',
-                          '22_puphon',
-                          '23_syll',
-                          '24_nbsyll',
-                          '25_cv-cv',
-                          '26_orthrenv',
-                          '27_phonrenv',
-                          '30_deflem',
-                          '31_defobs',
-                          '32_old20',
-                          '33_pld20',
-                          '34_morphoder',
-                          '35_nbmorph'])
-
-    # filter rows: ortho or lemme column string length > 2 (same as >= 3)
-    df = df[df["ortho"].astype(str).str.len() > 2]
-    df = df[df['lemme'].astype(str).str.len() > 2]
-
-    # misc removals of known bogus
-    df = df[df['lemme'].astype(str) != 'FALSE']
-    df = df[df['lemme'].astype(str) != 'TRUE']
-    df = df[df['lemme'].astype(str) != 'zzz']
-    df = df[df['lemme'].astype(str) != 'zzzz']
-    df = df[df['lemme'].astype(str) != 'o']
-    df = df[df['lemme'].astype(str) != 'team']
-    df = df[df['lemme'].astype(str) != '58e']
-
-    # rename "cgram" column to .lower()
-    df['cgram'] = df['cgram'].str.lower()
-
-    # filter rows for cgram equals desired_POS
-    df = df[df['cgram'].isin(desired_POS)]
-
-    # filter for highest priority POS
-    df = filter_df_for_highest_pos(df)
+    # nothing to do if neither the lexique nor the rules changed since the last write
+    manifest = BuildManifest(os.path.dirname(output_file_path))
+    lexique_hash = snapshot_key(input_file_path, filter_config())
+    if manifest.is_current(output_file_path, lexique_hash):
+        print(f'Up to date, skipped: {output_file_path}')
+        load_offset_index(output_file_path)  # (re)builds the index if it's missing
+        return
+
+    # count of rows each filter rule removed
+    rule_hits = Counter()
+
+    df = filter_lexique(rule_hits)
 
     # create a new ODS document
     df.to_csv(output_file_path, index=False, encoding='utf-8')
+    manifest.record(output_file_path, lexique_hash)
     print(f'Wrote clean .csv file saved to: {output_file_path}')
 
+    # each lemme's byte range in the output, for reading single lemmes back (see offset_index.py)
+    build_offset_index(output_file_path)
+
+    # empty when the rows came from the snapshot
+    for rule, hits in rule_hits.items():
+        print(f'\t{rule}: removed {hits} rows')
+
+
+def filter_lexique(rule_hits=None, instruments=None) -> pd.DataFrame:
+    # read, filter and keep the highest priority POS. re-runs load the cached snapshot instead
+    def build():
+        with section(instruments, 'read_lexique') as s:
+            df = read_lexique(input_file_path, read_chunk_rows, rule_hits)
+            s['rows_out'] = len(df)
+        with section(instruments, 'filter_df_for_highest_pos', rows_in=len(df)) as s:
+            df = filter_df_for_highest_pos(df)
+            s['rows_out'] = len(df)
+        return df
+
+    return load_cached(input_file_path, filter_config(), build, 'stage1')
+
+
+def filter_config() -> dict:
+    # everything besides the lexique itself that changes the filtered output. dtypes by repr(), str() of
+    # a CategoricalDtype is just 'category' whatever its categories
+    return {'filter_rules': filter_rules, 'lexique_columns': lexique_columns,
+            'lexique_dtypes': {column: repr(dtype) for column, dtype in lexique_dtypes.items()},
+            'SCHEMA_VERSION': SCHEMA_VERSION}
 
-def filter_df_for_highest_pos(df) -> pd.DataFrame:
-    # add column with POS rank
-    df['pos_rank'] = df['cgram'].apply(lambda pos: desired_POS.index(pos) if pos in desired_POS else len(desired_POS))
 
-    # get lemmes and their corresponding rows
-    lemmes, lemme_to_df_lookup = group_dfs_by_lemme(df)
+def read_lexique(file_path, chunk_rows=None, rule_hits=None) -> pd.DataFrame:
+    """
+    Read only the columns in lexique_columns, typed as lexique_dtypes, and apply the row filters.
+    If chunk_rows is set the .csv is streamed and each chunk is filtered before the next is read,
+    so we never hold the unfiltered lexique in memory.
+    """
+    rules = compile_filter_rules(filter_rules)
 
-    # free old df - we'll be reconstructing it from scratch
-    del df
-    gc.collect()
+    read_kwargs = dict(usecols=list(lexique_columns), dtype=lexique_dtypes)
+    if chunk_rows is None:
+        return filter_rows(pd.read_csv(file_path, **read_kwargs).rename(columns=lexique_columns), rules, rule_hits)
 
-    # populate df with only highest priority POS for each lemme
-    df = pd.DataFrame()
-    for l in lemmes:
-        # get all rows associated with this lemme
-        lemme_df = lemme_to_df_lookup[l]
+    chunks = [filter_rows(chunk.rename(columns=lexique_columns), rules, rule_hits)
+              for chunk in pd.read_csv(file_path, chunksize=chunk_rows, **read_kwargs)]
+    return pd.concat(chunks, ignore_index=True)
 
-        # filter
-        min_rank = lemme_df['pos_rank'].min()
-        lemme_df = lemme_df[lemme_df['pos_rank'] == min_rank]
 
-        # append filtered rows to df
-        df = pd.concat([df, lemme_df], ignore_index=True)
+def compile_filter_rules(rules) -> (dict, list):
+    """
+    Turn the rule set into:
+        {column: normaliser} applied to the str version of each column before testing
+        [(rule name, column, test)] where test(str column) returns a boolean mask of rows to keep
+    """
+    normalise = {}
+    for column, op in rules.get('normalise', {}).items():
+        if op not in normalisers:
+            raise ValueError(f'Unknown normaliser "{op}" for column "{column}" in {filter_rules_path}')
+        normalise[column] = normalisers[op]
 
-    # remove unneeded POS rank
-    df = df.drop(columns=['pos_rank'])
+    tests = []
+    for column, min_len in rules.get('min_length', {}).items():
+        tests.append((f'min_length {column}', column, lambda s, n=min_len: s.str.len().to_numpy() >= n))
+    for column, blocked in rules.get('blocklist', {}).items():
+        tests.append((f'blocklist {column}', column, lambda s, values=blocked: ~s.isin(values).to_numpy()))
+    for column, allowed in rules.get('whitelist', {}).items():
+        tests.append((f'whitelist {column}', column, lambda s, values=allowed: s.isin(values).to_numpy()))
 
-    return df
+    return normalise, tests
 
 
-def group_dfs_by_lemme(df) -> (list, dict):
+def filter_rows(df, rules, rule_hits=None) -> pd.DataFrame:
     """
-    Create a list of unique lexique lemmes.
-    Create a dict of dataframes belonging to each lemme.
+    Apply compiled filter rules as one combined mask. Each column a rule looks at is converted to str once.
+    rule_hits (a Counter) gets the number of rows each rule removed, crediting a row to the first rule it failed.
     """
-    df_columns = df.columns
+    normalise, tests = rules
+
+    # str (and normalised) version of every column the rules look at
+    as_str = {}
+    for column in {column for _, column, _ in tests} | set(normalise):
+        as_str[column] = df[column].astype(str)
+        if column in normalise:
+            as_str[column] = normalise[column](as_str[column])
+
+    keep = np.ones(len(df), dtype=bool)
+    for name, column, test in tests:
+        passed = test(as_str[column])
+        if rule_hits is not None:
+            rule_hits[name] += int((keep & ~passed).sum())
+        keep &= passed
 
-    unique_lemmes = []
-    lemme_to_df_lookup = {}
+    df = df[keep]
+
+    # normalised columns are written back. cgram only has whitelisted POS left so it gets a small fixed category set
+    for column in normalise:
+        df = df.assign(**{column: as_str[column][keep]})
+    return df.assign(cgram=df['cgram'].astype(pos_dtype(desired_POS)))
+
+
+def filter_df_for_highest_pos(df) -> pd.DataFrame:
+    """
+    Keep only the rows with the highest priority POS (lowest desired_POS index) for each lemme.
+    Lemmes come out in first-seen order with their rows in original order, all integer ops on the codes.
+    The lemme column comes out encoded (see lexique_schema.py).
+    """
+    # rank each row's POS by table lookup - code -1 (not whitelisted) lands on the last entry, ranked last
+    pos_codes = df['cgram'].astype(pos_dtype(desired_POS)).cat.codes.to_numpy()
+    pos_rank = pos_ranks[pos_codes]
 
-    lemme_df = None
-    for idx, row in df.iterrows():
-        lemme = row['lemme']
-        if lemme not in lemme_to_df_lookup:
-            # add unique lemme to list
-            unique_lemmes.append(lemme)
+    # number the lemmes in the order they're first seen
+    lemme_codes, lemmes = first_seen_codes(df['lemme'])
 
-            # init dataframe for lemme
-            lemme_to_df_lookup[lemme]: pd.DataFrame = pd.DataFrame(columns=df_columns)
+    # keep every row tied with its lemme's best rank
+    min_rank = np.full(len(lemmes), pos_ranks.max(), dtype=pos_ranks.dtype)
+    np.minimum.at(min_rank, lemme_codes, pos_rank)
+    keep = pos_rank == min_rank[lemme_codes]
 
-        # update lemme's dataframe
-        df_row = pd.DataFrame([row]) # prevent pandas from crushing our Series into a new column...
-        lemme_to_df_lookup[lemme] = pd.concat([lemme_to_df_lookup[lemme], df_row], ignore_index=True)
+    # stable sort on the codes makes each lemme's rows contiguous without reordering them. one take for both
+    kept = np.flatnonzero(keep)
+    kept = kept[np.argsort(lemme_codes[kept], kind='stable')]
 
-    return unique_lemmes, lemme_to_df_lookup
+    # lemmes stay as read (no str cast) so the filtered .csv is unchanged, just encoded from the codes we have
+    df = df.iloc[kept].reset_index(drop=True)
+    return df.assign(lemme=categorical_from_codes(lemme_codes[kept], lemmes))
 
 
 if __name__ == '__main__':
-    # ignore pandas 'FutureWarning: The behavior of DataFrame concatenation with empty or all-NA entries is deprecated. In a future version, this will no longer exclude empty or all-NA columns when determining the result dtypes. To retain the old behavior, exclude the relevant entries before the concat operation.'
-    with warnings.catch_warnings():
-        warnings.filterwarnings('ignore', category=FutureWarning)
-        main()
+    main()
@@ -2,9 +2,19 @@
 Slice filtered .csv lexique into smaller files containing 500 lemmes apiece.
 
 Works, mostly. Missed one word out of over 40,000 - good enough.
+(The missed word has no islem == 1 row, so it's never a candidate.)
 """
+import numpy as np
 import pandas as pd
 import os
+import re
+
+from build_manifest import BuildManifest, input_hash
+from chunk_dataset import build_dataset, write_dataset
+from instrumentation import section
+from lemme_index import LemmeIndex
+from lexique_schema import NUMERIC_DTYPES, SCHEMA_VERSION, categorical_from_codes, encode, encode_lemmes
+from snapshot_cache import load_cached
 
 
 # === CONFIGURATION ===
@@ -14,72 +24,202 @@ OUTPUT_FOLDER = f'{USER_PATH}/Documents/flashcard_project_new/lexique_exported_f
 CHUNK_SIZE = 500
 SPOKEN_COUNT = 400
 WRITTEN_COUNT = 100
+DATASET_PATH = None  # e.g. f'{OUTPUT_FOLDER}/lexique_chunks.parquet', every chunk in one file (chunk_dataset.py)
 
-# === STEP 1: LOAD CSV ===
-df_all = pd.read_csv(INPUT_FILE, encoding='utf-8')
-df_all.columns = [col.strip().lower() for col in df_all.columns]
 
-# Ensure 'lemme' is string
-df_all['lemme'] = df_all['lemme'].astype(str)
+def main():
+    # === STEP 1: LOAD CSV ===
+    # re-runs memory-map a snapshot of the parsed csv instead of parsing it again
+    df_all = load_cached(INPUT_FILE, {'CHUNK_SIZE': CHUNK_SIZE, 'SPOKEN_COUNT': SPOKEN_COUNT, 'WRITTEN_COUNT': WRITTEN_COUNT,
+                                      'SCHEMA_VERSION': SCHEMA_VERSION}, load_input, 'stage2')
 
-# Working dataset will be reduced as we process
-df_working = df_all.copy()
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    # Freq files whose rows didn't change since the last run are left alone
+    manifest = BuildManifest(OUTPUT_FOLDER)
+    if DATASET_PATH:
+        spoken_counts = []
+        chunks = list(make_chunks(df_all, spoken_counts=spoken_counts))
+        write_chunk_dataset(chunks, spoken_counts, manifest)
+    else:
+        write_chunks(make_chunks(df_all), manifest)
 
-# chunk_num = 0
-start_idx = 1
+    print("\nDone: All chunks generated.")
 
-while True:
-    # === STEP 2: TOP 400 LEMMES BY SPOKEN FREQUENCY (ISLEM == 1)
-    spoken_candidates = (
-        df_working[df_working['islem'] == 1]
-        .drop_duplicates(subset='lemme')
-        .sort_values(by='freqlemfilms', ascending=False)
-    )
 
-    if spoken_candidates.empty:
-        break  # done
+def load_input():
+    return clean_input(pd.read_csv(INPUT_FILE, encoding='utf-8'))
 
-    top_spoken_lemmes = spoken_candidates['lemme'].tolist()[:SPOKEN_COUNT]
 
-    # === STEP 3: COLLECT ALL ROWS FOR THESE LEMMES (regardless of islem)
-    spoken_rows = pd.DataFrame()
-    for lemme in top_spoken_lemmes:
-        matches = df_working[df_working['lemme'] == lemme]
-        spoken_rows = pd.concat([spoken_rows, matches], ignore_index=True)
-        df_working = df_working[df_working['lemme'] != lemme]
+def clean_input(df) -> pd.DataFrame:
+    df = df.copy()
+    df.columns = [col.strip().lower() for col in df.columns]
 
-    # === STEP 4: TOP 100 WRITTEN LEMMES BY freqlemlivres (ISLEM == 1)
-    written_candidates = (
-        df_working[df_working['islem'] == 1]
-        .drop_duplicates(subset='lemme')
-        .sort_values(by='freqlemlivres', ascending=False)
-    )
+    # the numbers typed like stage 1's frame, so the chunk hashes match whether it came from there or from the .csv
+    df = df.astype({col: dtype for col, dtype in NUMERIC_DTYPES.items() if col in df})
 
-    top_written_lemmes = written_candidates['lemme'].tolist()[:WRITTEN_COUNT]
+    # Ensure 'lemme' is string, encoded as codes into a vocabulary along with cgram/genre/nombre (see lexique_schema.py)
+    return encode(df)
 
-    written_rows = pd.DataFrame()
-    for lemme in top_written_lemmes:
-        matches = df_working[df_working['lemme'] == lemme]
-        written_rows = pd.concat([written_rows, matches], ignore_index=True)
-        df_working = df_working[df_working['lemme'] != lemme]
 
-    # === STEP 5: COMBINE AND EXPORT
-    chunk_df = pd.concat([spoken_rows, written_rows], ignore_index=True)
+def make_chunks(df_all, instruments=None, spoken_counts=None):
+    """
+    Yield (start_idx, end_idx, chunk_df) for every chunk, start_idx/end_idx being the frequency
+    range of the chunk's lemmes. spoken_counts, if given, gets each chunk's number of spoken lemmes.
+    """
+    # === STEP 2: PLAN EVERY CHUNK UP FRONT
+    with section(instruments, 'plan_chunks', rows_in=len(df_all)) as s:
+        chunks = plan_chunks(df_all, spoken_counts)
+        s['rows_out'] = sum(len(chunk) for chunk in chunks)
 
-    # calculate end index
-    total_lemmes = len(set(chunk_df['lemme']))
-    end_idx = start_idx + total_lemmes - 1
+    # === STEP 3: COLLECT ALL ROWS FOR EACH CHUNK'S LEMMES (regardless of islem)
+    with section(instruments, 'collect_chunk_rows', rows_in=len(df_all)) as s:
+        chunk_dfs = collect_chunk_rows(df_all, chunks)
+        s['rows_out'] = sum(len(chunk_df) for chunk_df in chunk_dfs)
 
-    # save file
-    filename = f'Freq {start_idx} - {end_idx}.csv'
+    start_idx = 1
+    for chunk_lemmes, chunk_df in zip(chunks, chunk_dfs):
+        # calculate end index
+        end_idx = start_idx + len(chunk_lemmes) - 1
+
+        yield start_idx, end_idx, chunk_df
+
+        # === PREPARE FOR NEXT CHUNK
+        start_idx = end_idx + 1
+
+
+def write_chunk(start_idx, end_idx, chunk_df, manifest=None):
+    filename = chunk_filename(start_idx, end_idx)
     filepath = os.path.join(OUTPUT_FOLDER, filename)
-    chunk_df.to_csv(filepath, index=False, encoding='utf-8')
-    print(f"{filename}\tlen(set(chunk_df['lemme'])) = {total_lemmes} lemmes")
 
-    # === PREPARE FOR NEXT CHUNK
-    start_idx = end_idx + 1
-    # chunk_num += 1
+    # skip the write if the file already holds exactly these rows
+    chunk_hash = input_hash(chunk_df) if manifest is not None else None
+    if manifest is not None and manifest.is_current(filepath, chunk_hash):
+        print(f"{filename}\tunchanged, skipped")
+        return
 
-print("\nDone: All chunks generated.")
+    # save file
+    chunk_df.to_csv(filepath, index=False, encoding='utf-8')
+    if manifest is not None:
+        manifest.record(filepath, chunk_hash)
+    print(f"{filename}\tlen(set(chunk_df['lemme'])) = {end_idx - start_idx + 1} lemmes")
+
+
+def write_chunks(chunks, manifest=None):
+    """
+    write_chunk() every (start_idx, end_idx, chunk_df). The manifest ends up listing just these Freq files,
+    so stage 3's BATCH_MODE leaves the ones an earlier chunking (another CHUNK_SIZE etc.) wrote alone.
+    """
+    written = set()
+    for start_idx, end_idx, chunk_df in chunks:
+        write_chunk(start_idx, end_idx, chunk_df, manifest)
+        written.add(chunk_filename(start_idx, end_idx))
+
+    if manifest is not None:
+        manifest.forget([name for name in manifest.hashes if is_chunk_filename(name) and name not in written])
+
+
+def chunk_filename(start_idx, end_idx) -> str:
+    return f'Freq {start_idx} - {end_idx}.csv'
+
+
+def is_chunk_filename(name) -> bool:
+    return re.fullmatch(r'Freq \d+ - \d+\.csv', name) is not None
+
+
+def write_chunk_dataset(chunks, spoken_counts, manifest=None):
+    """Every chunk into DATASET_PATH, with chunk_id / freq_rank / source columns."""
+    dataset = build_dataset(chunks, spoken_counts)
+
+    # skip the write if the file already holds exactly these rows
+    dataset_hash = input_hash(dataset) if manifest is not None else None
+    if manifest is not None and manifest.is_current(DATASET_PATH, dataset_hash):
+        print(f"{DATASET_PATH}\tunchanged, skipped")
+        return
+
+    write_dataset(dataset, DATASET_PATH)
+    if manifest is not None:
+        manifest.record(DATASET_PATH, dataset_hash)
+    print(f"{DATASET_PATH}\t{len(chunks)} chunks, {len(dataset)} rows")
+
+
+def plan_chunks(df, spoken_counts=None) -> list:
+    """
+    Split the lemmes into chunks of the top SPOKEN_COUNT remaining lemmes by freqlemfilms followed by
+    the top WRITTEN_COUNT remaining lemmes by freqlemlivres (only lemmes with an islem == 1 row count).
+    spoken_counts, if given, gets how many lemmes of each chunk came from the spoken ranking.
+    Each chunk ranks the lemmes still left, the same sort_values() as ever: its default quicksort isn't stable,
+    so the order of lemmes with tied frequencies (thousands at 0.0) depends on exactly which ones are left.
+    That's a full sort per chunk, quadratic in the lemme count: 0.3-0.6s at Lexique's 140k rows, ~35s at
+    1M rows. A bigger lexique wants one stable ranking up front, at the price of a different tie order.
+    Example:
+        [["lemme1", "lemme2", ...], ["lemme501", ...], ...]
+    """
+    # everything below works on the lemmes' integer codes, decoded once at the end
+    lemmes = encode_lemmes(df['lemme'])
+    vocabulary = np.append(lemmes.cat.categories.to_numpy(dtype=object), np.nan)  # code -1 (missing) is last
+
+    # one candidate row per lemme: its first islem == 1 row
+    candidates = np.flatnonzero((df['islem'] == 1).to_numpy())
+    codes = lemmes.cat.codes.to_numpy()[candidates]
+    first = np.sort(np.unique(codes, return_index=True)[1])
+    candidates, codes = candidates[first], codes[first]
+
+    # float64 like read_csv() gives, the float32 frame could sort ties differently
+    spoken_freqs = df['freqlemfilms'].to_numpy(dtype=np.float64)[candidates]
+    written_freqs = df['freqlemlivres'].to_numpy(dtype=np.float64)[candidates]
+
+    chunks = []
+    left = np.ones(len(candidates), dtype=bool)
+    while True:
+        # === TOP 400 LEMMES BY SPOKEN FREQUENCY
+        spoken = top_left(spoken_freqs, left, SPOKEN_COUNT)
+
+        if not len(spoken):
+            break  # done
+        left[spoken] = False
+
+        # === TOP 100 WRITTEN LEMMES NOT ALREADY TAKEN
+        written = top_left(written_freqs, left, WRITTEN_COUNT)
+        left[written] = False
+
+        chunks.append(vocabulary[codes[np.concatenate((spoken, written))]].tolist())
+        if spoken_counts is not None:
+            spoken_counts.append(len(spoken))
+
+    return chunks
+
+
+def top_left(freqs, left, count) -> np.ndarray:
+    """Positions of the count most frequent candidates still left, ties in the order sort_values() leaves them."""
+    positions = np.flatnonzero(left)
+    return positions[pd.Series(freqs[positions]).sort_values(ascending=False).index[:count].to_numpy()]
+
+
+def collect_chunk_rows(df, chunks) -> list:
+    """
+    Get a DataFrame per chunk holding every row of its lemmes, lemme by lemme in chunk order
+    with each lemme's rows kept in file order.
+    """
+    lemme_index = LemmeIndex(df)
+
+    # every chunk's rows in one take, the lemme column left out: each chunk gets its own lemmes as categories
+    # rather than the whole vocabulary (to_csv() and parquet go through every category)
+    lemmes = [lemme for chunk in chunks for lemme in chunk]
+    sizes = lemme_index.sizes(lemmes)
+    rows = df.drop(columns='lemme').iloc[lemme_index.positions(lemmes)]
+    row_bounds = np.concatenate(([0], np.cumsum(sizes)))
+    lemme_bounds = np.concatenate(([0], np.cumsum([len(chunk) for chunk in chunks])))
+    lemme_at = df.columns.get_loc('lemme')
+
+    chunk_dfs = []
+    for i, chunk in enumerate(chunks):
+        first, last = row_bounds[lemme_bounds[i]], row_bounds[lemme_bounds[i + 1]]
+        codes = np.repeat(np.arange(len(chunk), dtype=np.int32), sizes[lemme_bounds[i]:lemme_bounds[i + 1]])
+        chunk_df = rows.iloc[first:last].reset_index(drop=True)
+        chunk_df.insert(lemme_at, 'lemme', categorical_from_codes(codes, chunk))
+        chunk_dfs.append(chunk_df)
+    return chunk_dfs
+
+if __name__ == '__main__':
+    main()
@@ -12,12 +12,26 @@ Note 2: The Lexique 3.83 excel was already sorted such that nombre 's' came prio
         a quick sort (not actually quicksort, jeez) to do that within the POS for each lemme.
 
 """
+import contextlib
+import glob
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
 
+import card_templates as tpl
+from build_manifest import MANIFEST_NAME, BuildManifest, input_hash
+from chunk_dataset import chunk_ranges, read_dataset
+from declension_cache import DeclensionCache, declension_signature
+from instrumentation import Instruments, section
+from lemme_index import LemmeIndex
+from lexique_schema import SCHEMA_VERSION, encode
+from pronunciation import pronunciations
+from snapshot_cache import load_cached
+from stages import load_stage
+
 # TODO
 #   - fix naming discrepancy
 #   - probably should be merged into one giant script
@@ -25,12 +39,33 @@ import pandas as pd
 # === Configuration variables ===
 USER_PATH = os.path.expanduser('~')
 INPUT_CSV = f'{USER_PATH}/Documents/flashcard_project_new/lexique_exported_files/Freq 1 - 500.csv'
+INPUT_DIR = f'{USER_PATH}/Documents/flashcard_project_new/lexique_exported_files'
+BATCH_MODE = False  # True formats every 'Freq X - Y.csv' in INPUT_DIR instead of just INPUT_CSV
+INPUT_DATASET = None  # e.g. stage 2's DATASET_PATH, formats its chunks instead of any .csv
+DATASET_CHUNKS = None  # e.g. [0, 1], only those chunk_ids of INPUT_DATASET
+COMBINED_DECK = False  # True also writes every deck of the run into one COMBINED_DECK_NAME file
+COMBINED_DECK_NAME = 'anki_deck_all.csv'
 OUTPUT_DIR = f'{USER_PATH}/Documents/flashcard_project_new/anki_lexique_imports'
 OUTPUT_PREFIX = 'anki_deck_'
 CHUNK_SIZE = 500
+WORKERS = 1  # processes formatting lemmes in parallel, e.g. os.cpu_count()
+SHARDS_PER_WORKER = 4  # lemme shards handed to each worker per deck, more evens out slow shards
+DECLENSION_CACHE_SIZE = 100_000  # declensions kept in memory
+DECLENSION_CACHE_DB = None  # e.g. f'{OUTPUT_DIR}/declension_cache.sqlite' to keep declensions between runs
+REPORT_PATH = None  # e.g. f'{OUTPUT_DIR}/format_report.json' for timings, branch counts and failures instead of printing them
 
 # === End Config ===
 
+# bump whenever the formatting rules change so the build manifest rebuilds every deck
+# (and the declension cache drops its entries)
+FORMAT_VERSION = 2
+
+# the only columns the formatters read, a deck is rebuilt when these change for any of its lemmes
+FORMAT_COLUMNS = ['ortho', 'lemme', 'cgram', 'genre', 'nombre', 'orthosyll']
+
+# a deck's columns, in order
+EXPORT_COLUMNS = ['Lemme', 'Noun Declension', 'Pronunciation', 'Sound', 'English Meaning', 'POS', 'Tags']
+
 # POS priority for sorting and filtering
 POS_PRIORITY = ['adj', 'adv', 'pre', 'ver', 'ono', 'nom', 'con']
 
@@ -41,149 +76,537 @@ HARD_CODED_ADJ_4_ROWS = {
     'aucun', 'aucune', 'aucuns', 'aucunes',
 }
 SPECIAL_LEMME_FOIS = 'fois'
+# every lemme handle_hard_coded_formats() knows
+HARD_CODED_LEMMES = HARD_CODED_BOLD | HARD_CODED_ADJ_4_ROWS | {'oeil', 'lieu', SPECIAL_LEMME_FOIS}
 
+# POS that only ever get the bold header
+INVARIANT_POS = {'ver', 'adv', 'pre', 'con', 'ono'}
+
+
+class LexRow:
+    """
+    The bits of one lexique row the formatters use. genre/nombre are None when missing.
+    Much cheaper than a DataFrame for the 1-4 rows a lemme has.
+    """
+    __slots__ = ('ortho', 'lemme', 'cgram', 'genre', 'nombre', 'orthosyll')
+
+    def __init__(self, ortho, lemme, cgram, genre, nombre, orthosyll):
+        self.ortho = ortho
+        self.lemme = lemme
+        self.cgram = cgram
+        self.genre = genre
+        self.nombre = nombre
+        self.orthosyll = orthosyll
+
+    def copy(self):
+        return LexRow(self.ortho, self.lemme, self.cgram, self.genre, self.nombre, self.orthosyll)
 
-def main():
-    formatting_exception_count = 0
 
-    # load pandas
-    df = pd.read_csv(INPUT_CSV)
+def to_lex_rows(df) -> list:
+    """A LexRow per row of df, in order."""
+    def column(name, missing_as_none=False):
+        values = df[name].to_numpy(dtype=object)
+        return np.where(pd.isna(values), None, values).tolist() if missing_as_none else values.tolist()
 
-    # calculate starting frequency index from filename
-    freq_start = parse_start_frequency(INPUT_CSV)
+    return [LexRow(*values) for values in zip(column('ortho'), column('lemme'), column('cgram'),
+                                              column('genre', True), column('nombre', True), column('orthosyll'))]
+
+
+def main():
+    # one file, or every chunk file stage 2 made (neither with INPUT_DATASET)
+    input_files = find_chunk_files(INPUT_DIR) if BATCH_MODE else [INPUT_CSV]
 
     # ensure output directory exists
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-    # create a set of {"lemme1":[row_A, row_B], "lemme2":[row_X,...]} & ["lemme1", "lemme2", ...]
-    lemmes, lemme_to_rows = group_rows_by_lemme(df)
+    # decks for COMBINED_DECK
+    deck_files = []
+
+    # decks whose rows and formatting rules didn't change since the last run are skipped
+    manifest = BuildManifest(OUTPUT_DIR)
+
+    # declensions are memoised across every file (and across runs with DECLENSION_CACHE_DB)
+    cache = open_declension_cache()
+
+    # failures go in the report rather than on screen
+    instruments = Instruments(trace_memory=True) if REPORT_PATH else None
+
+    # one pool for every file
+    with worker_pool() as pool:
+        for freq_start, df in read_chunks(input_files, instruments):
+            for start_idx, end_idx, export_df in format_decks(df, freq_start, pool, manifest, cache, instruments):
+                if export_df is not None:
+                    with section(instruments, 'write_deck', rows_in=len(export_df)):
+                        write_deck(start_idx, end_idx, export_df)
+                deck_files.append(deck_path(start_idx, end_idx))
+
+    cache.close()
+    print(f'Declension cache: {cache.hits} hits, {cache.misses} misses')
+
+    if COMBINED_DECK:
+        write_combined_deck(deck_files)
+
+    if instruments is not None:
+        instruments.count('declension_cache', 'hits', cache.hits)
+        instruments.count('declension_cache', 'misses', cache.misses)
+        instruments.write(REPORT_PATH)
+        instruments.close()
+        print(f'{len(instruments.failures)} formatting exceptions, report written to {REPORT_PATH}')
+
+
+def read_chunks(input_files, instruments=None):
+    """
+    Yield (freq_start, df) for every chunk to format, encoded (see lexique_schema.py). freq_start is
+    the frequency index of df's first lemme.
+    """
+    if INPUT_DATASET:
+        # the dataset knows its chunks' ranges, and reading one chunk only reads its row group
+        for chunk_id, freq_start, _ in chunk_ranges(INPUT_DATASET):
+            if DATASET_CHUNKS is not None and chunk_id not in DATASET_CHUNKS:
+                continue
+            with section(instruments, 'read_chunk') as s:
+                df = encode(read_dataset(INPUT_DATASET, chunk_ids=[chunk_id]))
+                s['rows_out'] = len(df)
+            yield freq_start, df
+        return
+
+    for input_file in input_files:
+        # load pandas - re-runs memory-map a snapshot of the parsed csv instead
+        with section(instruments, 'read_chunk') as s:
+            df = load_cached(input_file, {'CHUNK_SIZE': CHUNK_SIZE, 'SCHEMA_VERSION': SCHEMA_VERSION},
+                             lambda: encode(pd.read_csv(input_file)), 'stage3')
+            s['rows_out'] = len(df)
+
+        # calculate starting frequency index from filename
+        yield parse_start_frequency(input_file), df
+
+
+def find_chunk_files(input_dir) -> list:
+    """
+    Every 'Freq X - Y.csv' in input_dir, ordered by X. With stage 2's build manifest in input_dir, just the
+    ones its last run wrote: files left over from an earlier chunking would be formatted into decks twice.
+    Raises ValueError if two files' frequency ranges overlap anyway.
+    """
+    paths = glob.glob(os.path.join(glob.escape(input_dir), 'Freq * - *.csv'))
+
+    if os.path.exists(os.path.join(input_dir, MANIFEST_NAME)):
+        written = BuildManifest(input_dir).hashes
+        for path in paths:
+            if os.path.basename(path) not in written:
+                print(f'{os.path.basename(path)}\tnot written by the last stage 2 run, skipped')
+        paths = [path for path in paths if os.path.basename(path) in written]
+
+    paths.sort(key=lambda path: parse_frequency_range(os.path.basename(path)))
+    for previous, path in zip(paths, paths[1:]):
+        if parse_frequency_range(os.path.basename(path))[0] <= parse_frequency_range(os.path.basename(previous))[1]:
+            raise ValueError(f'{previous} and {path} overlap, delete the stale one (or re-run stage 2)')
+    return paths
+
+
+def format_decks(df, freq_start, pool=None, manifest=None, cache=None, instruments=None):
+    """
+    Format every lemme in df into Anki import rows, CHUNK_SIZE lemmes per deck.
+    Yields (start_idx, end_idx, export_df) for each deck. freq_start is the frequency index of df's first lemme.
+    With a pool (see worker_pool()) lemmes are sharded across its processes. Output is the same either way.
+    With a manifest, decks already written from the same rows and FORMAT_VERSION aren't formatted and
+    come back with export_df None. The others are recorded once the caller has written them.
+    With a cache (see open_declension_cache()) lemmes whose rows it has seen skip the declension formatters.
+    With instruments (see instrumentation.py) the steps are timed, formatter branches counted and
+    formatting failures kept in instruments.failures instead of being printed.
+    """
+    formatting_exception_count = 0
+
+    with section(instruments, 'format_decks.index', rows_in=len(df)) as s:
+        # index every lemme's rows once & get ["lemme1", "lemme2", ...] in file order
+        lemme_index = LemmeIndex(df)
+        lemmes = lemme_index.lemmes
+
+        # every lemme's bold header, elided in one go
+        headers = tpl.bold_headers(lemmes)
+
+        # lemmes with a trivial shape get their field here, all at once. only the rest go through format_lemme()
+        shapes = classify_lemmes(lemme_index, headers)
+        rendered = shapes['branch'].notna().to_numpy()
+        pronunciation = shapes['pronunciation'].to_numpy()
+
+        # LexRows only for the lemmes left to format_lemme(), lemme i's being lex_rows[row_bounds[i]:row_bounds[i + 1]]
+        sizes = np.diff(lemme_index.bounds)
+        row_bounds = np.concatenate(([0], np.cumsum(np.where(rendered, 0, sizes))))
+        lex_rows = to_lex_rows(lemme_index.grouped.iloc[np.repeat(~rendered, sizes)])
+        s['rows_out'] = len(lemmes)
 
     # process lemme in chunks of CHUNK_SIZE
     for chunk_idx in range(0, len(lemmes), CHUNK_SIZE):
         export_rows = []
         lemme_chunk = lemmes[chunk_idx : chunk_idx + CHUNK_SIZE]
 
-        for lemme in lemme_chunk:
-            lemme_df = pd.DataFrame(lemme_to_rows[lemme])
-            pos = lemme_df['cgram'].iloc[0]
-
-            # format 'Noun Declension' field
-            noun_decl = format_noun_declension(lemme, lemme_df, pos)
-
-            # if formatting fails, print all rows for this lemme and POS with nombre and ortho for debug
-            if noun_decl is None:
-                formatting_exception_count += 1
-                print(f"Unhandled case for {lemme}, {pos}")
-                for _, r in lemme_df.iterrows():
-                    ortho_val = r.get('ortho', 'NaN')
-                    genre_val = r.get('genre', 'NaN')
-                    nombre_val = r.get('nombre', 'NaN')
-                    print(f"\tortho: {ortho_val}, genre: {genre_val}, nombre: {nombre_val}")
-
-                # default leave field blank - easier to find and fix by
-                noun_decl = ''
-
-            # copy orthosyll column to pronunciation column - use matching lemme orthosyll if available
-            pronun_row = lemme_df[lemme_df['ortho'] == lemme]
-            if not pronun_row.empty:
-                pronun = pronun_row['orthosyll'].iloc[0]
-            else:
-                pronun = lemme_df['orthosyll'].iloc[0]
-
-            # prepare row for export
-            if noun_decl is not False:
-                if isinstance(noun_decl, list):
-                    noun_decls = noun_decl # it's hideous, i know, i'm sorry
-                    for noun_decl in noun_decls:
-                        # apply contraction rule to noun_decl
-                        noun_decl = apply_contraction(noun_decl)
-
-                        # append
-                        export_rows.append({
-                            'Lemme': lemme,
-                            'Noun Declension': noun_decl,
-                            'Pronunciation': pronun,
-                            'Sound': '',
-                            'English Meaning': '',
-                            'POS': pos.lower(),
-                            'Tags': '',
-                        })
-                else:
-                    # apply contraction rule to noun_decl
-                    noun_decl = apply_contraction(noun_decl)
-
-                    # append
-                    export_rows.append({
-                        'Lemme': lemme,
-                        'Noun Declension': noun_decl,
-                        'Pronunciation': pronun,
-                        'Sound': '',
-                        'English Meaning': '',
-                        'POS': pos.lower(),
-                        'Tags': '',
-                    })
-
-        # output file name
+        # deck's frequency range
         start_idx = freq_start + chunk_idx
         end_idx = start_idx + len(lemme_chunk) - 1
-        out_file = os.path.join(
-            OUTPUT_DIR, f'{OUTPUT_PREFIX}{start_idx}-{end_idx}.csv'
-        )
 
-        # Create DataFrame for export
-        export_df = pd.DataFrame(export_rows)
+        if manifest is not None:
+            # the deck's lemmes are consecutive codes so their rows are one slice of grouped
+            deck_rows = lemme_index.grouped.iloc[lemme_index.bounds[chunk_idx]:lemme_index.bounds[chunk_idx + len(lemme_chunk)]]
+            deck_hash = input_hash(deck_rows[FORMAT_COLUMNS], format_config())
+            if manifest.is_current(deck_path(start_idx, end_idx), deck_hash):
+                print(f'Up to date, skipped {deck_path(start_idx, end_idx)}')
+                yield start_idx, end_idx, None
+                continue
+
+        # positions of the deck's lemmes, rendered already or needing format_lemme()
+        deck_rendered = np.flatnonzero(rendered[chunk_idx : chunk_idx + len(lemme_chunk)]) + chunk_idx
+        formatted = np.flatnonzero(~rendered[chunk_idx : chunk_idx + len(lemme_chunk)]) + chunk_idx
+
+        lemme_rows = [(lemmes[i], lex_rows[row_bounds[i]:row_bounds[i + 1]], headers[i], pronunciation[i])
+                      for i in formatted]
+
+        # (lemme, rows, header, cached declension or None, pronunciation). lookups happen here so workers never
+        # touch the cache
+        if cache is None:
+            jobs = [(lemme, rows, header, None, pronun) for lemme, rows, header, pronun in lemme_rows]
+        else:
+            signatures = [declension_signature(lemme, rows) for lemme, rows, _, _ in lemme_rows]
+            jobs = [(lemme, rows, header, cache.get(signature), pronun)
+                    for (lemme, rows, header, pronun), signature in zip(lemme_rows, signatures)]
 
-        # Export CSV with UTF-8 and without index
-        export_df.to_csv(out_file, index=False, encoding='utf-8')
+        with section(instruments, 'format_decks.format', rows_in=len(jobs)) as s:
+            if pool is None:
+                results = format_shard(jobs)
+            else:
+                # contiguous shards so results come back in frequency order
+                shard_size = -(-len(jobs) // (WORKERS * SHARDS_PER_WORKER))
+                shards = [jobs[i : i + shard_size] for i in range(0, len(jobs), shard_size)]
+                results = [result for shard in pool.map(format_shard, shards) for result in shard]
+
+            if cache is not None:
+                for signature, (_, _, _, cached, _), (_, _, declension, _) in zip(signatures, jobs, results):
+                    if cached is None:
+                        cache.put(signature, declension)
+                cache.commit()
+
+            # debug lines for the whole deck, printed in one go after
+            failures = []
+            # lemme position of each of export_rows
+            export_order = []
+            for i, (lemme, _, _, _, _), (lemme_export_rows, unhandled, _, branch) in zip(formatted, jobs, results):
+                # if formatting failed, keep all rows for this lemme and POS with nombre and ortho for debug
+                if unhandled:
+                    formatting_exception_count += 1
+                    if instruments is None:
+                        failures.extend(unhandled)
+                    else:
+                        instruments.fail('format', deck=os.path.basename(deck_path(start_idx, end_idx)),
+                                         lemme=lemme, lines=unhandled)
+                if instruments is not None:
+                    instruments.count('formatter_branch', branch)
+                export_rows.extend(lemme_export_rows)
+                export_order.extend([i] * len(lemme_export_rows))
+
+            if instruments is not None:
+                for branch in shapes['branch'].to_numpy()[deck_rendered]:
+                    instruments.count('formatter_branch', branch)
+
+            # Create DataFrame for export, the rendered lemmes' rows slotted in between
+            export_df = merge_export_rows(shapes, deck_rendered, export_rows, export_order)
+            s['rows_out'] = len(export_df)
+
+        if instruments is None:
+            if failures:
+                print('\n'.join(failures))
+            print(f'Formatting exceptions: {formatting_exception_count}\n')
+        yield start_idx, end_idx, export_df
+
+        # we only get back here after the caller is done with the deck, i.e. it's been written
+        if manifest is not None:
+            manifest.record(deck_path(start_idx, end_idx), deck_hash)
+
+
+def merge_export_rows(shapes, rendered, export_rows, export_order) -> pd.DataFrame:
+    """
+    One deck's export rows in lemme order: a row for each position in rendered from shapes (see classify_lemmes())
+    plus format_lemme()'s export_rows, export_order holding the position of each one's lemme.
+    """
+    if not len(rendered):
+        return pd.DataFrame(export_rows)
+
+    # a lemme is one or the other, the stable sort keeps a formatted lemme's own rows in order
+    order = np.argsort(np.concatenate([rendered, np.asarray(export_order, dtype=np.intp)]), kind='stable')
+
+    def column(rendered_values, field):
+        formatted_values = np.array([row[field] for row in export_rows] + [None], dtype=object)[:-1]
+        return np.concatenate([rendered_values, formatted_values])[order]
+
+    blank = np.full(len(rendered), '', dtype=object)
+    return pd.DataFrame({'Lemme': column(shapes['lemme'].to_numpy()[rendered], 'Lemme'),
+                         'Noun Declension': column(shapes['noun_declension'].to_numpy()[rendered], 'Noun Declension'),
+                         'Pronunciation': column(shapes['pronunciation'].to_numpy()[rendered], 'Pronunciation'),
+                         'Sound': column(blank, 'Sound'),
+                         'English Meaning': column(blank, 'English Meaning'),
+                         'POS': column(np.array([pos.lower() for pos in shapes['pos'].to_numpy()[rendered]],
+                                                dtype=object), 'POS'),
+                         'Tags': column(blank, 'Tags')}, columns=EXPORT_COLUMNS, dtype=object)
+
+
+def format_config() -> dict:
+    # everything besides the rows that changes what a deck looks like
+    return {'FORMAT_VERSION': FORMAT_VERSION,
+            'POS_PRIORITY': POS_PRIORITY,
+            'HARD_CODED_BOLD': sorted(HARD_CODED_BOLD),
+            'HARD_CODED_ADJ_4_ROWS': sorted(HARD_CODED_ADJ_4_ROWS),
+            'SPECIAL_LEMME_FOIS': SPECIAL_LEMME_FOIS,
+            }
+
+
+def open_declension_cache() -> DeclensionCache:
+    """
+    Declension cache for format_decks(), tied to format_config(). close() it when done.
+    Editing HARD_CODED_ADJ_4_ROWS etc. changes the version, so DECLENSION_CACHE_DB's old entries are misses.
+    """
+    version = f'{FORMAT_VERSION}-{input_hash(config=format_config())[:16]}'
+    return DeclensionCache(version, DECLENSION_CACHE_SIZE, DECLENSION_CACHE_DB)
+
+
+def worker_pool():
+    """
+    Process pool to pass to format_decks(), or a do-nothing context giving None when WORKERS is 1.
+    Use as: with worker_pool() as pool: ...
+    """
+    if WORKERS <= 1:
+        return contextlib.nullcontext()
+
+    # this file can't be imported by name (spaces) so when we were loaded through stages.py
+    # have every worker load it the same way before unpickling format_shard
+    if __name__ == '__main__':
+        return ProcessPoolExecutor(max_workers=WORKERS)
+    return ProcessPoolExecutor(max_workers=WORKERS, initializer=load_stage, initargs=(3,))
 
-        print(f'Formatting exceptions: {formatting_exception_count}\n')
-        print(f'Exported {len(lemme_chunk)} lemme to {out_file}')
+
+def format_shard(jobs) -> list:
+    """
+    Worker entry point: format_lemme() every (lemme, LexRow list, header, cached declension, pronunciation) job,
+    in order.
+    """
+    return [format_lemme(lemme, rows, header, declension, pronun) for lemme, rows, header, declension, pronun in jobs]
 
 
-def group_rows_by_lemme(df) -> (list, dict):
+def format_lemme(lemme, lex_rows, header=None, declension=None, pronunciation=None) -> (list, list, list, str):
     """
-    Create a list of unique lexique lemmes.
-    Create a dict of rows belonging to each lemme.
-    Example:
-        [ "lemme1", "lemme2", "lemme3" ]
-        {"lemme1":[row_A, row_B], "lemme2":[row_C,...]}
+    Format one lemme's LexRows into its export rows.
+    Returns (export_rows, unhandled, declension, branch) where unhandled holds the debug lines to print when no
+    rule matched, declension is the cache entry: [format_noun_declension() result, [[genre, nombre], ...]],
+    genre/nombre being each row's values after the formatters filled in what they could, and branch is
+    the formatter_branch() that produced it.
+    Pass that entry back in as declension to skip the formatters.
+    header is the lemme's header from card_templates.bold_headers(), worked out here if not given.
+    pronunciation is its 'Pronunciation' (see pronunciation.py), likewise.
+    """
+    export_rows = []
+    unhandled = []
+
+    # copies: the formatters fill in missing genre/nombre in place
+    rows = [r.copy() for r in lex_rows]
+    pos = rows[0].cgram
+
+    # format 'Noun Declension' field
+    if declension is None:
+        if header is None:
+            header = tpl.bold_headers([lemme])[0]
+        noun_decl = format_noun_declension(lemme, rows, pos, header)
+        declension = [noun_decl, [[r.genre, r.nombre] for r in rows]]
+    else:
+        # cached, just put the filled in genre/nombre back for the debug lines
+        noun_decl, filled = declension
+        for r, (genre, nombre) in zip(rows, filled):
+            r.genre, r.nombre = genre, nombre
+
+    branch = formatter_branch(lemme, rows, pos, noun_decl)
+
+    # if formatting fails, keep all rows for this lemme and POS with nombre and ortho for debug
+    if noun_decl is None:
+        unhandled.append(f"Unhandled case for {lemme}, {pos}")
+        for r in rows:
+            genre_val = 'nan' if r.genre is None else r.genre
+            nombre_val = 'nan' if r.nombre is None else r.nombre
+            unhandled.append(f"\tortho: {r.ortho}, genre: {genre_val}, nombre: {nombre_val}")
+
+        # default leave field blank - easier to find and fix by
+        noun_decl = ''
+
+    # copy orthosyll column to pronunciation column - use matching lemme orthosyll if available
+    # (pronunciation.py picks it for every lemme at once, this is the same rule for one)
+    if pronunciation is None:
+        pronunciation = next((r for r in rows if r.ortho == lemme), rows[0]).orthosyll
+
+    # prepare row for export
+    if noun_decl is not False:
+        if isinstance(noun_decl, list):
+            noun_decls = noun_decl # it's hideous, i know, i'm sorry
+            for noun_decl in noun_decls:
+                # append
+                export_rows.append({
+                    'Lemme': lemme,
+                    'Noun Declension': noun_decl,
+                    'Pronunciation': pronunciation,
+                    'Sound': '',
+                    'English Meaning': '',
+                    'POS': pos.lower(),
+                    'Tags': '',
+                })
+        else:
+            # append
+            export_rows.append({
+                'Lemme': lemme,
+                'Noun Declension': noun_decl,
+                'Pronunciation': pronunciation,
+                'Sound': '',
+                'English Meaning': '',
+                'POS': pos.lower(),
+                'Tags': '',
+            })
+
+    return export_rows, unhandled, declension, branch
+
+
+def formatter_branch(lemme, rows, pos, noun_decl) -> str:
+    """Which part of format_noun_declension() handled the lemme, for the report's counts."""
+    if noun_decl is None:
+        return 'none'
+    if lemme in HARD_CODED_LEMMES:
+        return 'hard_coded'
+    if pos in INVARIANT_POS:
+        return 'invariant'
+    if 'adj' in pos and (len(rows) == 1 or all(r.ortho == lemme and r.genre is None for r in rows)):
+        return 'adj_bold'
+    if 'adj' in pos and len(rows) == 4:
+        return 'adj_four'
+    return {1: 'single_row', 2: 'two_row', 3: 'noun_three', 4: 'noun_four'}.get(len(rows), 'other')
+
+
+def classify_lemmes(lemme_index, headers) -> pd.DataFrame:
     """
-    unique_lemmes = []
-    lemme_row_lookup = {}
+    Every lemme's shape from grouped aggregates over lemme_index.grouped, and the 'Noun Declension' field of
+    those whose shape doesn't need the formatters, rendered for all of them at once with card_templates.fill():
+        invariant   INVARIANT_POS                                         header
+        adj_bold    adj*, one row or every ortho the lemme and no genre   header
+        single_row  nom, one row with nombre p or a genre                 NOM_PLURAL_ONLY, NOM_MASC or NOM_FEM
+        two_row     nom or adj*, two rows with one genre between them     NOM_MASC or NOM_FEM, for plain adj
+                    (m or f, the other row may have none)                 ADJ_MASC_PLURAL or ADJ_FEM_PLURAL
+    Same results as format_noun_declension() gives them. Hard coded lemmes and everything else are left to
+    format_lemme().
+    Returns a frame with a row per lemme in lemme_index order: lemme, pos, branch (formatter_branch() name, None
+    when not rendered here), noun_declension and pronunciation (orthosyll, see pronunciation.py).
+    """
+    lemmes = np.array(lemme_index.lemmes + [None], dtype=object)[:-1]  # [None] keeps numpy from making a str array
+    if not len(lemmes):
+        return pd.DataFrame(columns=['lemme', 'pos', 'branch', 'noun_declension', 'pronunciation'], dtype=object)
+
+    grouped = lemme_index.grouped
+    starts = lemme_index.bounds[:-1]
+    n_rows = np.diff(lemme_index.bounds)
+    headers = np.array(headers + [None], dtype=object)[:-1]
+
+    ortho = grouped['ortho'].to_numpy(dtype=object)
+    genre = grouped['genre'].to_numpy(dtype=object)
+    nombre = grouped['nombre'].to_numpy(dtype=object)
+    pos = grouped['cgram'].to_numpy(dtype=object)[starts]
+
+    # per lemme: missing genre count, which genres and nombres show up (bits m f s p) and whether every ortho
+    # is the lemme
+    is_lemme = ortho == np.repeat(lemmes, n_rows)
+    genre_missing = np.add.reduceat(pd.isna(genre).astype(np.intp), starts)
+    forms = np.bitwise_or.reduceat((genre == 'm') * 1 | (genre == 'f') * 2 | (nombre == 's') * 4 | (nombre == 'p') * 8,
+                                   starts)
+    has_m, has_f, has_p = (forms & 1) > 0, (forms & 2) > 0, (forms & 8) > 0
+    all_lemme = np.add.reduceat(is_lemme.astype(np.intp), starts) == n_rows
+
+    # grouped keeps the lemmes in lemme_index order
+    pronunciation = pronunciations(grouped).to_numpy()
+
+    plain = np.array([isinstance(lemme, str) and lemme not in HARD_CODED_LEMMES for lemme in lemmes])
+    # 'adj' in pos like format_noun_declension() checks it, so adj:ind etc. too
+    adjective = np.array([isinstance(p, str) and 'adj' in p for p in pos])
+    invariant = plain & np.isin(pos, list(INVARIANT_POS))
+    adj_bold = plain & adjective & ((n_rows == 1) | (all_lemme & (genre_missing == n_rows)))
+    single_row = plain & (pos == 'nom') & (n_rows == 1) & (has_p | has_m | has_f)
+    # with exactly one genre the nombres don't change the result, a missing one is only ever inferred
+    two_row = plain & ((pos == 'nom') | adjective) & ~adj_bold & (n_rows == 2) & (has_m != has_f)
+
+    branch = np.full(len(lemmes), None, dtype=object)
+    noun_decl = np.full(len(lemmes), None, dtype=object)
+
+    def render(name, mask, layout, **fields):
+        branch[mask] = name
+        if mask.any():
+            noun_decl[mask] = tpl.fill(layout, **{field: values[mask] for field, values in fields.items()})
+
+    render('invariant', invariant, tpl.BOLD, header=headers)
+    render('adj_bold', adj_bold, tpl.BOLD, header=headers)
+
+    # single row: only a plural, else masculine or feminine
+    plural_only = single_row & has_p
+    render('single_row', plural_only, tpl.NOM_PLURAL_ONLY, pl=ortho[starts])
+    render('single_row', single_row & ~plural_only & has_m, tpl.NOM_MASC, lemme=lemmes, pl=ortho[starts])
+    render('single_row', single_row & ~plural_only & has_f, tpl.NOM_FEM, lemme=lemmes, pl=ortho[starts])
+
+    # two rows: the second row's ortho is the plural, as format_noun_declension_nom() has it
+    plural = ortho[np.minimum(starts + 1, len(ortho) - 1)]
+    render('two_row', two_row & (pos != 'adj') & has_m, tpl.NOM_MASC, lemme=lemmes, pl=plural)
+    render('two_row', two_row & (pos != 'adj') & has_f, tpl.NOM_FEM, lemme=lemmes, pl=plural)
+    render('two_row', two_row & (pos == 'adj') & has_m, tpl.ADJ_MASC_PLURAL, header=headers, pl=plural)
+    render('two_row', two_row & (pos == 'adj') & has_f, tpl.ADJ_FEM_PLURAL, header=headers, pl=plural)
 
-    for idx, row in df.iterrows():
-        lemme = row['lemme']
-        if lemme not in lemme_row_lookup:
-            lemme_row_lookup[lemme] = []
-            unique_lemmes.append(lemme)
-        lemme_row_lookup[lemme].append(row)
+    return pd.DataFrame({'lemme': lemmes, 'pos': pos, 'branch': branch, 'noun_declension': noun_decl,
+                         'pronunciation': pronunciation}, dtype=object)
+
+
+def deck_path(start_idx, end_idx):
+    return os.path.join(OUTPUT_DIR, f'{OUTPUT_PREFIX}{start_idx}-{end_idx}.csv')
+
+
+def write_deck(start_idx, end_idx, export_df):
+    # output file name
+    out_file = deck_path(start_idx, end_idx)
+
+    # Export CSV with UTF-8 and without index
+    export_df.to_csv(out_file, index=False, encoding='utf-8')
+
+    print(f'Exported {end_idx - start_idx + 1} lemme to {out_file}')
+
+
+def write_combined_deck(deck_files):
+    # deck_files are in frequency order already. read back from disk since skipped decks were never in memory
+    out_file = os.path.join(OUTPUT_DIR, COMBINED_DECK_NAME)
+    pd.concat([pd.read_csv(path, keep_default_na=False) for path in deck_files],
+              ignore_index=True).to_csv(out_file, index=False, encoding='utf-8')
+    print(f'Exported combined deck to {out_file}')
 
-    return unique_lemmes, lemme_row_lookup
 
 # Extract frequency start index from filename like 'Freq 1-500.csv
 def parse_start_frequency(filename):
-    match = re.search(r'Freq (\d+) - \d+', filename)
+    return parse_frequency_range(filename)[0]
+
+
+# (start, end) frequency indices from a filename like 'Freq 1 - 500.csv'
+def parse_frequency_range(filename):
+    match = re.search(r'Freq (\d+) - (\d+)', filename)
     if not match:
         raise ValueError('Invalid filename: ' + filename + '\n\nFilename is required to match format to accuracately determine frequency index.')
-    return int(match.group(1))
+    return int(match.group(1)), int(match.group(2))
 
 # apply correct formatting rule based on pos and lemme.
-def format_noun_declension(lemme, lemme_df, pos):
-    # we'll just pre-compute this junk. it's a little inefficient but it reduces code complexity
-    c_lemme_male = apply_contraction(f"le {lemme}")
-    c_lemme_fem = apply_contraction(f"la {lemme}")
-
+# header: the lemme's bold header (see card_templates.bold_headers())
+def format_noun_declension(lemme, rows, pos, header):
     # check for hard-coded exceptions first
-    hard_coded_format = handle_hard_coded_formats(lemme_df, lemme, c_lemme_male, c_lemme_fem)
+    hard_coded_format = handle_hard_coded_formats(rows, lemme)
     if hard_coded_format is not None or hard_coded_format is False:
         return hard_coded_format
 
-    if pos in {'ver', 'adv', 'pre', 'con', 'ono'}:
-        return format_bold(lemme)
+    if pos in INVARIANT_POS:
+        return tpl.BOLD(header=header)
     elif pos == 'nom':
-        return format_noun_declension_nom(lemme_df, lemme, c_lemme_male, c_lemme_fem)
+        return format_noun_declension_nom(rows, lemme, header)
     elif 'adj' in pos:
-        return format_noun_declension_adj(lemme_df, lemme, c_lemme_male, c_lemme_fem)
+        return format_noun_declension_adj(rows, lemme, header)
 
     # If no rule matched
     return None
@@ -191,10 +614,10 @@ def format_noun_declension(lemme, lemme_df, pos):
 
 # pretty self explanatory
 # note: returning false prevents duplicates from getting exported. DO NOT CHANGE THIS TO None.
-def handle_hard_coded_formats(rows, lemme, c_lemme_male, c_lemme_fem):
+def handle_hard_coded_formats(rows, lemme):
     if lemme in {'quelque', 'quelques'}:
         if lemme == 'quelque':
-            return f"<b>quelque</b> [<gr><i>pl. </i></gr>quelques]"
+            return tpl.ADJ_PLURAL(header='<b>quelque</b>', pl='quelques')
         else:
             return False
 
@@ -202,21 +625,13 @@ def handle_hard_coded_formats(rows, lemme, c_lemme_male, c_lemme_fem):
     elif lemme == 'oeil':
         return f"<b>l'oeil</b> [<gr><i>pl. </i></gr><blue>les yeux</blue>]"
     elif lemme == 'lieu':
-        return f"<b>lieu</b> [<gr><i>pl. </i></gr>lieux]"
+        return tpl.ADJ_PLURAL(header='<b>lieu</b>', pl='lieux')
 
     elif lemme in HARD_CODED_ADJ_4_ROWS:
         if lemme == 'tout':
-            return (f"<b>tout</b> ["
-                    f"<gr><i>ms. </i></gr><blue>tout</blue>; "
-                    f"<gr><i>mpl. </i></gr><blue>tous</blue>; "
-                    f"<gr><i>fs. </i></gr><red>toute</red>; "
-                    f"<gr><i>fpl. </i></gr><red>toutes</red>]")
+            return tpl.ADJ_FOUR(header='<b>tout</b>', ms='tout', mpl='tous', fs='toute', fpl='toutes')
         if lemme == 'aucun':
-            return (f"<b>aucun</b> ["
-                    f"<gr><i>ms. </i></gr><blue>aucun</blue>; "
-                    f"<gr><i>mpl. </i></gr><blue>aucuns</blue>; "
-                    f"<gr><i>fs. </i></gr><red>aucune</red>; "
-                    f"<gr><i>fpl. </i></gr><red>aucunes</red>]")
+            return tpl.ADJ_FOUR(header='<b>aucun</b>', ms='aucun', mpl='aucuns', fs='aucune', fpl='aucunes')
         else:
             return False
     if lemme == SPECIAL_LEMME_FOIS:
@@ -224,27 +639,9 @@ def handle_hard_coded_formats(rows, lemme, c_lemme_male, c_lemme_fem):
 
     return None
 
-def format_bold(lemme):
-    return f"<b>{lemme}</b>"
-
-
 # handle 'nom' POS formatting with genre and nombre rules
 # ...and some 'adj' stuff that should probably be abstracted
-def format_noun_declension_nom(rows, lemme, c_lemme_male, c_lemme_fem):
-    # helper to get row by genre and nombre with NaN checks
-    def get_row(genre_val=None, nombre_val=None):
-        cond = True
-        if genre_val is None:
-            cond &= rows['genre'].isna()
-        else:
-            cond &= rows['genre'] == genre_val
-        if nombre_val is None:
-            cond &= rows['nombre'].isna()
-        else:
-            cond &= rows['nombre'] == nombre_val
-        subset = rows[cond]
-        return subset.iloc[0] if not subset.empty else None
-
+def format_noun_declension_nom(rows, lemme, header):
     try:
         # special case for 'fois'
         if lemme == SPECIAL_LEMME_FOIS:
@@ -252,44 +649,44 @@ def format_noun_declension_nom(rows, lemme, c_lemme_male, c_lemme_fem):
 
         # single row cases
         if len(rows) == 1:
-            row = rows.iloc[0]
-            genre = row.get('genre', np.nan)
-            nombre = row.get('nombre', np.nan)
-            ortho = row['ortho']
+            row = rows[0]
+            genre = row.genre
+            nombre = row.nombre
+            ortho = row.ortho
 
             # assume this means only a plural form exists (e.g. you can have 'pants' but not 'pant')
             if nombre == "p":
-                return f"<b>les {ortho}</b>"
+                return tpl.NOM_PLURAL_ONLY(pl=ortho)
             # else assume there is always both a single & plural form
             #  (this could be wrong if a word is singular only, that's prob infrequent)
             else:
                 if genre == "m":
-                    return f"<b><blue>{c_lemme_male}</blue></b> [<gr><i>pl. </i></gr><blue>les {ortho}</blue>]"
+                    return tpl.NOM_MASC(lemme=lemme, pl=ortho)
                 elif genre == "f":
-                    return f"<b><red>{c_lemme_fem}</red></b> [<gr><i>pl. </i></gr><red>les {ortho}</red>]"
+                    return tpl.NOM_FEM(lemme=lemme, pl=ortho)
 
         # two row cases
         elif len(rows) == 2:
             # infer missing 'nombre'
-            if rows['nombre'].isna().sum() == 1:
-                idx = rows[rows['nombre'].isna()].index[0]
-                nombres = rows['nombre'].dropna()
+            missing_nombre = [r for r in rows if r.nombre is None]
+            if len(missing_nombre) == 1:
+                nombres = [r.nombre for r in rows if r.nombre is not None]
                 # if one is singular, then the other must be plural
-                if (nombres == "s").sum() == 1:
-                    rows.at[idx, 'nombre'] = "p"
+                if nombres.count("s") == 1:
+                    missing_nombre[0].nombre = "p"
                 # if one is plural, then the other must be singular
-                elif (nombres == "p").sum() == 1:
-                    rows.at[idx, 'nombre'] = "s"
+                elif nombres.count("p") == 1:
+                    missing_nombre[0].nombre = "s"
                 else:
                     return None
 
-            row1 = rows.iloc[0]
-            row2 = rows.iloc[1]
+            row1 = rows[0]
+            row2 = rows[1]
 
-            r1_genre = row1['genre']
-            r1_nombre = row1['nombre']
-            r2_genre = row2['genre']
-            r2_nombre = row2['nombre']
+            r1_genre = row1.genre
+            r1_nombre = row1.nombre
+            r2_genre = row2.genre
+            r2_nombre = row2.nombre
 
             """
             Ahh french, there's just this: Je ne sais pas
@@ -310,35 +707,34 @@ def format_noun_declension_nom(rows, lemme, c_lemme_male, c_lemme_fem):
              
              There's a surprising amount of these, roughly 7 / 500. Thanks French. 
             """
-            if pd.isna(row1['genre']) and pd.isna(row2['genre']) and r1_nombre == "s" and r2_nombre == "p" and row1["cgram"].lower() != 'adj':
-                return [f"<b><blue>{c_lemme_male}</blue></b> [<gr><i>pl. </i></gr><blue>les {row2['ortho']}</blue>]",
-                        f"<b><red>{c_lemme_fem}</red></b> [<gr><i>pl. </i></gr><red>les {row2['ortho']}</red>]"]
+            if r1_genre is None and r2_genre is None and r1_nombre == "s" and r2_nombre == "p" and row1.cgram.lower() != 'adj':
+                return [tpl.NOM_MASC(lemme=lemme, pl=row2.ortho), tpl.NOM_FEM(lemme=lemme, pl=row2.ortho)]
 
-            if pd.isna(row1['genre']) and pd.isna(row2['genre']) and r1_nombre == "s" and r2_nombre == "p" and row1["cgram"].lower() == 'adj':
-                return f"<b>{lemme}</b> [<gr><i>pl. </i></gr>{row2['ortho']}]"
+            if r1_genre is None and r2_genre is None and r1_nombre == "s" and r2_nombre == "p" and row1.cgram.lower() == 'adj':
+                return tpl.ADJ_PLURAL(header=header, pl=row2.ortho)
 
             # discard nouns with conflicting genres
             if (r1_genre == "m" and r2_genre == "f") or (r1_genre == "f" and r2_genre == "m"):
                 return None # no rule match
             # treat both rows as male, with first row 's' and second row "p"
             elif r1_genre == "m" or r2_genre == "m":
-                if row1["cgram"].lower() == 'adj':
-                    return f"<b>{lemme}</b> [<gr><i>mpl. </i></gr><blue>{row2['ortho']}</blue>]"
+                if row1.cgram.lower() == 'adj':
+                    return tpl.ADJ_MASC_PLURAL(header=header, pl=row2.ortho)
                 else:
-                    return f"<b><blue>{c_lemme_male}</blue></b> [<gr><i>pl. </i></gr><blue>les {row2['ortho']}</blue>]"
+                    return tpl.NOM_MASC(lemme=lemme, pl=row2.ortho)
             # treat both rows as female, with first row 's' and second row "p"
             elif r1_genre == "f" or r2_genre == "f":
-                if row1["cgram"].lower() == 'adj':
-                    return f"<b>{lemme}</b> [<gr><i>fpl. </i></gr><red>{row2['ortho']}</red>]"
+                if row1.cgram.lower() == 'adj':
+                    return tpl.ADJ_FEM_PLURAL(header=header, pl=row2.ortho)
                 else:
-                    return f"<b><red>{c_lemme_fem}</red></b> [<gr><i>pl. </i></gr><red>les {row2['ortho']}</red>]"
+                    return tpl.NOM_FEM(lemme=lemme, pl=row2.ortho)
 
         # my voluntary & entirely avoidable suffering is your flashcards
         elif len(rows) == 3:
-            return noun_three(rows, lemme, c_lemme_male, c_lemme_fem)
+            return noun_three(rows, lemme, header)
 
         elif len(rows) == 4:
-            return noun_four(rows, lemme)
+            return noun_four(rows, lemme, header)
 
         else:
             # if there's 5+ rows, then something is wrong, assume malformed and move on
@@ -348,14 +744,11 @@ def format_noun_declension_nom(rows, lemme, c_lemme_male, c_lemme_fem):
 
 
 # handle 'adj' POS formatting with genre and nombre rules.
-# rows: DataFrame subset for the lemme and POS = 'adj'
-def format_noun_declension_adj(rows, lemme, c_lemme_male, c_lemme_fem):
-    genre_vals = rows['genre'].dropna().unique()
-    nombre_vals = rows['nombre'].dropna().unique()
-
+# rows: LexRow list for the lemme and POS = 'adj'
+def format_noun_declension_adj(rows, lemme, header):
     # if one row OR genre empty and all ortho's are equal then treat as single ver/adv style
-    if len(rows) == 1 or (all(x == lemme for x in rows['ortho']) and rows['genre'].isna().all()):
-        return format_bold(lemme)
+    if len(rows) == 1 or (all(r.ortho == lemme for r in rows) and all(r.genre is None for r in rows)):
+        return tpl.BOLD(header=header)
 
     elif len(rows) == 4:
         # Expect ms, mpl, fs, fpl
@@ -365,19 +758,15 @@ def format_noun_declension_adj(rows, lemme, c_lemme_male, c_lemme_fem):
         fpl = find_row(rows, "f", "p")
         # nothing missing
         if ms is not None and mpl is not None and fs is not None and fpl is not None:
-            return (
-                f"<b>{lemme}</b> "
-                f"[<gr><i>ms. </i></gr><blue>{ms['lemme']}</blue>; "
-                f"<gr><i>mpl. </i></gr><blue>{mpl['lemme']}</blue>; "
-                f"<gr><i>fs. </i></gr><red>{fs['lemme']}</red>; "
-                f"<gr><i>fpl. </i></gr><red>{fpl['lemme']}</red>]"
-            )
+            return tpl.ADJ_FOUR(header=header, ms=ms.lemme, mpl=mpl.lemme, fs=fs.lemme, fpl=fpl.lemme)
         # one or more rows missing
         else:
             # one row missing
             if ((ms is not None and mpl is not None and fs is not None) or (ms is not None and mpl is not None and fpl is not None) or (ms is not None and fs is not None and fpl is not None) or (mpl is not None and fs is not None and fpl is not None)):
                 # assign ms|mpl|fs|fpl to row with missing genre/nombre malformed - process of elimination
-                malformed_row = rows[rows['genre'].isna() | rows['nombre'].isna()]
+                malformed_row = next((r for r in rows if r.genre is None or r.nombre is None), None)
+                if malformed_row is None:
+                    return None
                 if ms is not None and mpl is not None and fs is not None:
                     fpl = malformed_row
                 elif ms is not None and mpl is not None and fpl is not None:
@@ -388,123 +777,112 @@ def format_noun_declension_adj(rows, lemme, c_lemme_male, c_lemme_fem):
                     ms = malformed_row
 
                 # return corrected value
-                return (
-                    f"<b>{lemme}</b> "
-                    f"[<gr><i>ms. </i></gr><blue>{ms['lemme']}</blue>; "
-                    f"<gr><i>mpl. </i></gr><blue>{mpl['lemme']}</blue>; "
-                    f"<gr><i>fs. </i></gr><red>{fs['lemme']}</red>; "
-                    f"<gr><i>fpl. </i></gr><red>{fpl['lemme']}</red>]"
-                )
+                return tpl.ADJ_FOUR(header=header, ms=ms.lemme, mpl=mpl.lemme, fs=fs.lemme, fpl=fpl.lemme)
             # todo could fix infer more fixes, for example if ms and fpl were both missing but there were rows with m_ and _pl
 
     # if two or three rows, apply same rules as 'nom'
     elif len(rows) == 2 or len(rows) == 3:
-        result = format_noun_declension_nom(rows, lemme, c_lemme_male, c_lemme_fem)
+        result = format_noun_declension_nom(rows, lemme, header)
         if result is not None:
             return result
 
     return None
 
 
-def noun_three(df, lemme, c_lemme_male, c_lemme_fem):
-    rows = df[['ortho', 'genre', 'nombre', "cgram"]].copy()
+def noun_three(lemme_rows, lemme, header):
+    rows = [r.copy() for r in lemme_rows]
 
     # fail early if too many missing values
-    if rows['nombre'].isna().sum() > 1 or rows['genre'].isna().sum() > 1:
+    if sum(r.nombre is None for r in rows) > 1 or sum(r.genre is None for r in rows) > 1:
         return None
 
     # infer missing 'nombre'
-    if rows['nombre'].isna().any():
-        idx = rows[rows['nombre'].isna()].index[0]
-        nombres = rows['nombre'].dropna()
+    missing = next((r for r in rows if r.nombre is None), None)
+    if missing is not None:
+        nombres = [r.nombre for r in rows if r.nombre is not None]
         # if we have 2 singulars, then the other must be plural
-        if (nombres == "s").sum() == 2:
-            rows.at[idx, 'nombre'] = "p"
+        if nombres.count("s") == 2:
+            missing.nombre = "p"
         # if we have 1 singular and 1 plural, then the other must be singular
-        elif (nombres == "p").sum() == 1 and (nombres == "s").sum() == 1:
-            rows.at[idx, 'nombre'] = "s"
+        elif nombres.count("p") == 1 and nombres.count("s") == 1:
+            missing.nombre = "s"
         else:
             return None
 
     # infer missing 'genre' (only if 'nombre' is 's')
-    if rows['genre'].isna().any():
-        idx = rows[rows['genre'].isna()].index[0]
-        if rows.at[idx, 'nombre'] == "p":
+    missing = next((r for r in rows if r.genre is None), None)
+    if missing is not None:
+        if missing.nombre == "p":
             pass  # genre doesn't matter for plural
         else:
-            other = rows[(rows.index != idx) & (rows['nombre'] == "s")]
-            genres = other['genre'].dropna().unique()
+            other = [r for r in rows if r is not missing and r.nombre == "s"]
+            genres = list(dict.fromkeys(r.genre for r in other if r.genre is not None))
             if len(genres) == 1:
-                rows.at[idx, 'genre'] = "f" if genres[0] == "m" else "m"
+                missing.genre = "f" if genres[0] == "m" else "m"
             else:
                 return None
 
     # identify forms
-    masc_sing = rows[(rows['genre'] == "m") & (rows['nombre'] == 's')]
-    fem_sing = rows[(rows['genre'] == "f") & (rows['nombre'] == 's')]
-    plural = rows[rows['nombre'] == "p"]
+    masc_sing = [r for r in rows if r.genre == "m" and r.nombre == 's']
+    fem_sing = [r for r in rows if r.genre == "f" and r.nombre == 's']
+    plural = [r for r in rows if r.nombre == "p"]
 
     if len(masc_sing) != 1 or len(plural) != 1:
         return None
     if len(fem_sing) > 1:
         return None
 
-    ortho_m = masc_sing.iloc[0]['ortho']
-    ortho_p = plural.iloc[0]['ortho']
-    ortho_f = fem_sing.iloc[0]['ortho'] if not fem_sing.empty else None
+    ortho_m = masc_sing[0].ortho
+    ortho_p = plural[0].ortho
+    ortho_f = fem_sing[0].ortho if fem_sing else None
 
     # if both plural and feminine are the same as masculine, return None
     if (ortho_p == ortho_m) and (ortho_f is None or ortho_f == ortho_m):
         return None
 
     # only format if both forms differ
-    pos = rows.iloc[0]["cgram"].lower()
+    pos = rows[0].cgram.lower()
     if ortho_p != ortho_m and ortho_f and ortho_f != ortho_m:
         if pos == 'adj':
-            return f"<b>{lemme}</b> [<gr><i>m. </i></gr><blue>{ortho_m}</blue>; <gr><i>pl. </i></gr><blue>{ortho_p}</blue>; <gr><i>f. </i></gr><red>{ortho_f}</red>]"
+            return tpl.ADJ_MASC_PLURAL_FEM(header=header, m=ortho_m, pl=ortho_p, f=ortho_f)
         else:
-            return f"<b><blue>{c_lemme_male}</blue></b> [<gr><i>pl. </i></gr><blue>les {ortho_p}</blue>; <gr><i>f. </i></gr><red>la {ortho_f}</red>]"
+            return tpl.NOM_MASC_FEM(lemme=lemme, pl=ortho_p, f=ortho_f)
     elif ortho_p != ortho_m and (ortho_f is None or ortho_f == ortho_m):
         if pos == 'adj':
-            return f"<b>{lemme}</b> [<gr><i>s. </i></gr><blue>{ortho_m}</blue>; <gr><i>pl. </i></gr><blue>{ortho_p}</blue>]"
+            return tpl.ADJ_SING_PLURAL(header=header, s=ortho_m, pl=ortho_p)
         else:
-            return f"<b><blue>{c_lemme_male}</blue></b> [<gr><i>pl. </i></gr><blue>les {ortho_p}</blue>]"
+            return tpl.NOM_MASC(lemme=lemme, pl=ortho_p)
     elif ortho_f and ortho_f != ortho_m and ortho_p == ortho_m:
         if pos == 'adj':
-            return f"<b>{lemme}</b> [<gr><i>m. </i></gr><blue>{ortho_m}</blue>; <gr><i>pl. </i></gr><blue>{ortho_p}</blue>; <gr><i>f. </i></gr><red>{ortho_f}</red>]"
+            return tpl.ADJ_MASC_PLURAL_FEM(header=header, m=ortho_m, pl=ortho_p, f=ortho_f)
         else:
-            return f"<b><red>{c_lemme_fem}</red></b> [<gr><i>pl. </i></gr><red>les {ortho_p}</red>]"
+            return tpl.NOM_FEM(lemme=lemme, pl=ortho_p)
     else:
         return None
 
 
-def noun_four(df, lemme):
-    # work on a copy of relevant columns
-    rows = df[['ortho', 'genre', 'nombre']].copy()
-
-    # count missing fields per row
-    missing_genre_mask = rows['genre'].isna()
-    missing_nombre_mask = rows['nombre'].isna()
-    missing_both_mask = missing_genre_mask & missing_nombre_mask
+def noun_four(lemme_rows, lemme, header):
+    # work on copies, the caller's rows are left alone
+    rows = [r.copy() for r in lemme_rows]
 
-    # total missing counts
-    total_missing_genre = missing_genre_mask.sum()
-    total_missing_nombre = missing_nombre_mask.sum()
-    total_missing_both = missing_both_mask.sum()
+    # rows missing fields
+    missing_genre = [r for r in rows if r.genre is None]
+    missing_nombre = [r for r in rows if r.nombre is None]
+    missing_both = [r for r in missing_genre if r.nombre is None]
 
     # sanity checks
-    if total_missing_both > 1:
+    if len(missing_both) > 1:
         return None  # More than one row missing both - ambiguous
 
     # if there is one row missing both genre and nombre
-    if total_missing_both == 1:
+    if len(missing_both) == 1:
         # check that the other three rows have no missing fields
-        others = rows[~missing_both_mask]
-        if others['genre'].isna().any() or others['nombre'].isna().any():
+        others = [r for r in rows if r is not missing_both[0]]
+        if any(r.genre is None or r.nombre is None for r in others):
             return None  # Others must be complete
 
         # check others cover 3 distinct (genre,nombre) combos
-        combos = set(zip(others['genre'], others['nombre']))
+        combos = {(r.genre, r.nombre) for r in others}
         if len(combos) != 3:
             return None  # Not unique combos, can't infer
 
@@ -514,46 +892,40 @@ def noun_four(df, lemme):
         if len(missing_combo) != 1:
             return None  # Ambiguous missing combo
 
-        missing_genre, missing_nombre = missing_combo.pop()
         # assign missing fields to the missing_both row
-        idx = rows[missing_both_mask].index[0]
-        rows.at[idx, 'genre'] = missing_genre
-        rows.at[idx, 'nombre'] = missing_nombre
+        missing_both[0].genre, missing_both[0].nombre = missing_combo.pop()
 
     else:
         # no rows missing both fields
         # handle missing single fields (genre or nombre)
 
         # infer missing nombre if exactly one missing
-        if total_missing_nombre == 1:
-            idx = rows[missing_nombre_mask].index[0]
-            existing_nombres = set(rows.loc[~missing_nombre_mask, 'nombre'])
+        if len(missing_nombre) == 1:
+            existing_nombres = {r.nombre for r in rows if r is not missing_nombre[0]}
             expected_nombres = {'s', 'p'}
             missing_nombre_values = expected_nombres - existing_nombres
             if len(missing_nombre_values) != 1:
                 return None
-            rows.at[idx, 'nombre'] = missing_nombre_values.pop()
+            missing_nombre[0].nombre = missing_nombre_values.pop()
 
         # infer missing genre if exactly one missing
-        if total_missing_genre == 1:
-            idx = rows[missing_genre_mask].index[0]
-            row_nombre = rows.at[idx, 'nombre']
+        if len(missing_genre) == 1:
+            row_nombre = missing_genre[0].nombre
             if row_nombre not in {'s', "p"}:
                 return None  # nombre must be known to infer genre
-            same_nombre_rows = rows[(rows.index != idx) & (rows['nombre'] == row_nombre)]
-            existing_genres = set(same_nombre_rows['genre'].dropna())
+            same_nombre_rows = [r for r in rows if r is not missing_genre[0] and r.nombre == row_nombre]
+            existing_genres = {r.genre for r in same_nombre_rows if r.genre is not None}
             expected_genres = {'m', 'f'}
             missing_genres = expected_genres - existing_genres
             if len(missing_genres) != 1:
                 return None
-            rows.at[idx, 'genre'] = missing_genres.pop()
+            missing_genre[0].genre = missing_genres.pop()
 
     # after inference, if any genre or nombre is still missing, return None
-    if rows['genre'].isna().any() or rows['nombre'].isna().any():
+    if any(r.genre is None or r.nombre is None for r in rows):
         return None
 
     # validate that all (genre, nombre) combinations are unique and complete
-    combos_seen = set()
     groups = {
         ('m', 's'): None,
         ('m', "p"): None,
@@ -561,63 +933,27 @@ def noun_four(df, lemme):
         ('f', "p"): None,
     }
 
-    for _, row in rows.iterrows():
-        key = (row['genre'], row['nombre'])
+    for row in rows:
+        key = (row.genre, row.nombre)
         if key not in groups:
             return None  # invalid genre/number combo
         if groups[key] is not None:
             return None  # duplicate combo
-        groups[key] = row['ortho']
+        groups[key] = row.ortho
 
     # if any combo missing, return None
     if any(v is None for v in groups.values()):
         return None
 
     # format final string
-    return (
-        f"<b>{lemme}</b> ["
-        f"<gr><i>ms. </i></gr> <blue>le {groups[("m", 's')]}</blue>; "
-        f"<gr><i>mpl. </i></gr> <blue>les {groups[("m", "p")]}</blue>; "
-        f"<gr><i>fs. </i></gr> <red>la {groups[("f", 's')]}</red>; "
-        f"<gr><i>fpl. </i></gr> <red>les {groups[("f", "p")]}</red>"
-        "]"
-    )
+    return tpl.NOUN_FOUR(header=header, ms=groups[('m', 's')], mpl=groups[('m', "p")], fs=groups[('f', 's')],
+                         fpl=groups[('f', "p")])
 
 
 # returns the first row genre and nombre equal the inputs
 # None may be passed as NaN
 def find_row(rows, g, n):
-    if g is None and n is None:
-        r = rows[(rows['genre'].isna()) & (rows['nombre'].isna())]
-        return r.iloc[0] if not r.empty else None
-    elif g is None:
-        r = rows[(rows['genre'].isna()) & (rows['nombre'] == n)]
-        return r.iloc[0] if not r.empty else None
-    elif n is None:
-        r = rows[(rows['genre'] == g) & (rows['nombre'].isna())]
-        return r.iloc[0] if not r.empty else None
-    else:
-        r = rows[(rows['genre'] == g) & (rows['nombre'] == n)]
-        return r.iloc[0] if not r.empty else None
-
-
-# returns formatted article + word (ortho or lemme) w/ (f) if applicable
-# for male: return le + word | l'word
-# for fem:  return la + word | l'word (f)
-def apply_contraction(text) -> str:
-    def repl(m):
-        article = m.group(1)
-        word = m.group(2)
-        vowels = "aeiouhâàéèêëïîôùûü"
-        if word and word[0].lower() in vowels and article == "le":
-            return f"l'{word}"
-        elif word and word[0].lower() in vowels and article == "la":
-            return f"l'{word} (f)"
-        else:
-            return m.group(0)
-
-    pattern = re.compile(r"<b>(le|la|les) (\S+?)</b>")
-    return pattern.sub(repl, text)
+    return next((r for r in rows if r.genre == g and r.nombre == n), None)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,234 @@
+"""
+@Instructions:
+  1. Get a Forvo API key (or point API_BASE_URL at anything that answers the same way) and put it in
+     FORVO_API_KEY or API_KEY below.
+  2. Run after stage 3. Every anki_deck_X-Y.csv in DECK_DIR gets its 'Sound' field filled with
+     [sound:file.mp3] and the .mp3 files land in MEDIA_DIR.
+  3. Copy MEDIA_DIR's files into your Anki profile's collection.media folder before importing the decks.
+     Using COMBINED_DECK? Re-run stage 3 afterwards, it rebuilds the combined deck from the filled decks.
+
+@Purpose: Download a pronunciation per lemme, CONCURRENCY requests at a time over one pool of keep-alive
+          connections, never more than RATE_PER_SECOND requests a second (the free API tier has a daily quota
+          so mind the lemme count). Failed requests are retried with exponential backoff. Lemmes without
+          a recording keep an empty 'Sound' field, re-running only asks for those again.
+          Every clip also goes into the AUDIO_CACHE_DIR cache (see audio_cache.py) so rebuilt decks get
+          their audio back without a single request.
+          With SHARE_HOMOPHONE_AUDIO lemmes that sound the same (same phon in the Freq X - Y.csv files,
+          see phoneme_index.py) get one clip between them, fetched once.
+
+@Note: Needs aiohttp (pip install aiohttp).
+"""
+import asyncio
+import glob
+import os
+import shutil
+from urllib.parse import quote
+
+import pandas as pd
+
+from audio_cache import AudioCache
+from phoneme_index import PhonemeIndex
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# === Configuration ===
+USER_PATH = os.path.expanduser('~')
+DECK_DIR = f'{USER_PATH}/Documents/flashcard_project_new/anki_lexique_imports'
+DECK_PREFIX = 'anki_deck_'
+FREQ_DIR = f'{USER_PATH}/Documents/flashcard_project_new/lexique_exported_files'  # for the phon column
+SHARE_HOMOPHONE_AUDIO = True  # one clip per pronunciation rather than per lemme
+MEDIA_DIR = f'{USER_PATH}/Documents/flashcard_project_new/anki_media'
+AUDIO_CACHE_DIR = f'{USER_PATH}/Documents/flashcard_project_new/audio_cache'
+AUDIO_CACHE_BYTES = 2 * 1024 ** 3  # least recently used clips are deleted past this
+API_BASE_URL = 'https://apifree.forvo.com'  # e.g. 'http://localhost:8080' for a local stub
+API_KEY = os.environ.get('FORVO_API_KEY', '')
+LANGUAGE = 'fr'
+ACCENT = ''  # e.g. 'FRA' for speakers from France only, '' for anyone
+CONCURRENCY = 8  # requests in flight at once, also the connection pool size
+RATE_PER_SECOND = 5.0  # token bucket refill rate
+RATE_BURST = 10  # token bucket size
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 1.0  # doubled after every failed attempt
+TIMEOUT_SECONDS = 30
+# === End Config ===
+
+# worth another try, anything else is a final answer
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def main():
+    deck_files = find_deck_files(DECK_DIR)
+    phonemes = PhonemeIndex.from_csvs(glob.glob(os.path.join(glob.escape(FREQ_DIR), 'Freq * - *.csv')))
+    fill_sound_fields(deck_files, phonemes)
+    print('\nDone: Sound fields filled.')
+
+
+def find_deck_files(deck_dir) -> list:
+    """Every 'anki_deck_X-Y.csv' in deck_dir (not the combined deck)."""
+    return sorted(glob.glob(os.path.join(glob.escape(deck_dir), f'{DECK_PREFIX}*-*.csv')))
+
+
+def fill_sound_fields(deck_files, phonemes=None):
+    """
+    Fetch audio for every lemme with an empty 'Sound' field in deck_files and write the decks back.
+    phonemes is a PhonemeIndex covering the decks' lemmes, needed for SHARE_HOMOPHONE_AUDIO.
+    """
+    if aiohttp is None:
+        raise SystemExit('Fetching audio needs aiohttp: pip install aiohttp')
+
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+
+    decks = {path: pd.read_csv(path, keep_default_na=False, dtype={'Lemme': str}) for path in deck_files}
+
+    # each lemme once, however many cards or decks it's on
+    words = list(dict.fromkeys(word for deck in decks.values()
+                               for word in deck.loc[deck['Sound'] == '', 'Lemme']))
+
+    # lemmes that share a clip
+    if SHARE_HOMOPHONE_AUDIO and phonemes is not None:
+        groups = phonemes.group_by_sound(words)
+    else:
+        groups = [[word] for word in words]
+
+    cache = AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_BYTES)
+
+    # everything already cached costs no requests, a cached homophone counts
+    cached = cache.lookup(words, ACCENT, API_BASE_URL)
+    sounds = {}
+    missing = []
+    for group in groups:
+        clip_path = next((cached[word] for word in group if word in cached), None)
+        if clip_path is None:
+            missing.append(group)
+        else:
+            sounds.update(dict.fromkeys(group, add_to_media(clip_path)))
+    print(f'{len(words)} lemmes, {len(groups)} pronunciations. '
+          f'{len(groups) - len(missing)} cached, fetching {len(missing)}')
+
+    fetched = asyncio.run(fetch_sounds(cache, missing)) if missing else {}
+    print(f'Found audio for {sum(bool(sound) for sound in fetched.values())} of '
+          f'{sum(len(group) for group in missing)} lemmes')
+    sounds.update(fetched)
+    cache.close()
+
+    for path, deck in decks.items():
+        empty = deck['Sound'] == ''
+        deck.loc[empty, 'Sound'] = deck.loc[empty, 'Lemme'].map(sounds).fillna('')
+        deck.to_csv(path, index=False, encoding='utf-8')
+
+
+async def fetch_sounds(cache, groups) -> dict:
+    """
+    word -> '[sound:file.mp3]', or '' when there's no recording or every attempt failed.
+    groups are lists of words that sound the same, they all get the first recording found for any of them.
+    """
+    bucket = TokenBucket(RATE_PER_SECOND, RATE_BURST)
+    limit = asyncio.Semaphore(CONCURRENCY)
+
+    connector = aiohttp.TCPConnector(limit=CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=TIMEOUT_SECONDS)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def fetch(group):
+            async with limit:
+                # the group's next word only when there's nothing for the one before
+                for word in group:
+                    sound = await fetch_sound(session, bucket, cache, word, group)
+                    if sound:
+                        break
+                return dict.fromkeys(group, sound)
+
+        sounds = {}
+        for done, task in enumerate(asyncio.as_completed([fetch(group) for group in groups]), 1):
+            sounds.update(await task)
+            if done % 500 == 0:
+                print(f'\t{done} / {len(groups)}')
+        return sounds
+
+
+async def fetch_sound(session, bucket, cache, word, homophones=()) -> str:
+    """Fetch word's clip, cache it under word and all its homophones and return its Sound field, or ''."""
+    try:
+        found = await request(session, bucket, pronunciations_url(word), as_json=True)
+        items = found.get('items') if isinstance(found, dict) else None
+        if not items:
+            return ''
+        audio = await request(session, bucket, items[0]['pathmp3'])
+    except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError) as e:
+        print(f'No audio for {word}: {type(e).__name__} {e}')
+        return ''
+
+    speaker = items[0].get('username') or ''
+    clip_path = cache.put(word, audio, ACCENT, API_BASE_URL, speaker)
+    for homophone in homophones:
+        if homophone != word:
+            cache.put(homophone, audio, ACCENT, API_BASE_URL, speaker)
+    return add_to_media(clip_path)
+
+
+def add_to_media(clip_path) -> str:
+    """Copy a cached clip into MEDIA_DIR (named by its content hash) and return its Sound field."""
+    file_name = os.path.basename(clip_path)
+    media_path = os.path.join(MEDIA_DIR, file_name)
+    if not os.path.exists(media_path):
+        shutil.copyfile(clip_path, media_path)
+    return f'[sound:{file_name}]'
+
+
+async def request(session, bucket, url, as_json=False):
+    """GET url, waiting on the token bucket before every attempt. Retries RETRY_STATUSES and connection errors."""
+    for attempt in range(MAX_RETRIES + 1):
+        await bucket.take()
+        try:
+            async with session.get(url) as response:
+                if response.status not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return await response.json(content_type=None) if as_json else await response.read()
+                retry_after = response.headers.get('Retry-After')
+                error = aiohttp.ClientResponseError(response.request_info, response.history,
+                                                    status=response.status, message=response.reason)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            retry_after = None
+            error = e
+
+        if attempt == MAX_RETRIES:
+            raise error
+
+        delay = BACKOFF_SECONDS * 2 ** attempt
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, int(retry_after))
+        await asyncio.sleep(delay)
+
+
+class TokenBucket:
+    """Allows rate takes a second on average with bursts of up to capacity."""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = None
+
+    async def take(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self.updated is not None:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def pronunciations_url(word) -> str:
+    country = f'/country/{ACCENT}' if ACCENT else ''
+    return (f'{API_BASE_URL}/key/{API_KEY}/format/json/action/word-pronunciations'
+            f'/word/{quote(word, safe="")}/language/{LANGUAGE}{country}/order/rate-desc')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+@Instructions:
+  1. Run after stage 3 (and stage 4 if you want audio).
+  2. Double click the .apkg (or File > Import in Anki). Re-importing a newer package updates the notes
+     you already have, review history is kept.
+
+@Purpose: Pack every anki_deck_X-Y.csv in DECK_DIR, in frequency order, plus the audio their Sound fields
+          point at into one .apkg, see apkg_writer.py.
+"""
+import glob
+import os
+import re
+
+import pandas as pd
+
+from apkg_writer import write_apkg
+
+# === Configuration ===
+USER_PATH = os.path.expanduser('~')
+DECK_DIR = f'{USER_PATH}/Documents/flashcard_project_new/anki_lexique_imports'
+DECK_PREFIX = 'anki_deck_'
+MEDIA_DIR = f'{USER_PATH}/Documents/flashcard_project_new/anki_media'
+PACKAGE_PATH = f'{USER_PATH}/Documents/flashcard_project_new/lexique_french.apkg'
+DECK_NAME = 'Lexique French'
+NOTE_TYPE_NAME = 'Lexique French Word'  # changing this makes Anki treat every note as new
+# === End Config ===
+
+
+def main():
+    build_package(find_deck_files(DECK_DIR))
+
+
+def find_deck_files(deck_dir) -> list:
+    """Every 'anki_deck_X-Y.csv' in deck_dir, ordered by X."""
+    paths = glob.glob(os.path.join(glob.escape(deck_dir), f'{DECK_PREFIX}*-*.csv'))
+    return sorted(paths, key=lambda path: int(re.search(r'(\d+)-\d+\.csv$', path).group(1)))
+
+
+def build_package(deck_files):
+    notes = []
+    for path in deck_files:
+        notes.extend(pd.read_csv(path, dtype=str, keep_default_na=False).to_dict('records'))
+
+    note_count, media_count = write_apkg(PACKAGE_PATH, DECK_NAME, NOTE_TYPE_NAME, notes, MEDIA_DIR)
+    print(f'Wrote {note_count} notes and {media_count} media files to {PACKAGE_PATH}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Write Anki decks straight to an .apkg, no CSV import step and no copying media by hand.
+
+An .apkg is a zip of:
+    collection.anki2    SQLite collection (schema 11) holding the note type, the deck, the notes and their cards
+    media               json {"0": "file.mp3", ...}
+    0, 1, ...           the media files, renamed to their index
+
+Note, card, deck and note type ids plus note guids are all derived from names/lemmes, so importing a
+newer package updates the notes already in Anki instead of adding duplicates.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import zipfile
+
+FIELDS = ['Lemme', 'Noun Declension', 'Pronunciation', 'Sound', 'English Meaning', 'POS', 'Tags']
+
+FRONT = '{{Lemme}}<br>{{Sound}}'
+BACK = ('{{FrontSide}}<hr id=answer>{{Noun Declension}}<br><i>{{Pronunciation}}</i><br>'
+        '{{English Meaning}}<br><gr>{{POS}}</gr>')
+CSS = ('.card { font-family: arial; font-size: 20px; text-align: center; color: black; background-color: white; }\n'
+       'blue { color: #2a6fdb; }\nred { color: #d93636; }\ngr { color: grey; }\n')
+
+SOUND_REF = re.compile(r'\[sound:(.+?)\]')
+
+SCHEMA = '''
+CREATE TABLE col (
+    id integer primary key, crt integer not null, mod integer not null, scm integer not null,
+    ver integer not null, dty integer not null, usn integer not null, ls integer not null,
+    conf text not null, models text not null, decks text not null, dconf text not null, tags text not null
+);
+CREATE TABLE notes (
+    id integer primary key, guid text not null, mid integer not null, mod integer not null,
+    usn integer not null, tags text not null, flds text not null, sfld integer not null,
+    csum integer not null, flags integer not null, data text not null
+);
+CREATE TABLE cards (
+    id integer primary key, nid integer not null, did integer not null, ord integer not null,
+    mod integer not null, usn integer not null, type integer not null, queue integer not null,
+    due integer not null, ivl integer not null, factor integer not null, reps integer not null,
+    lapses integer not null, left integer not null, odue integer not null, odid integer not null,
+    flags integer not null, data text not null
+);
+CREATE TABLE revlog (
+    id integer primary key, cid integer not null, usn integer not null, ease integer not null,
+    ivl integer not null, lastIvl integer not null, factor integer not null, time integer not null,
+    type integer not null
+);
+CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX ix_notes_usn on notes (usn);
+CREATE INDEX ix_cards_usn on cards (usn);
+CREATE INDEX ix_revlog_usn on revlog (usn);
+CREATE INDEX ix_cards_nid on cards (nid);
+CREATE INDEX ix_cards_sched on cards (did, queue, due);
+CREATE INDEX ix_revlog_cid on revlog (cid);
+CREATE INDEX ix_notes_csum on notes (csum);
+'''
+
+
+def write_apkg(package_path, deck_name, model_name, notes, media_dir):
+    """
+    Write notes (dicts keyed by FIELDS, in the order the cards should be learnt) to package_path.
+    Files named in the notes' [sound:...] references are taken from media_dir.
+    """
+    now = int(time.time())
+    deck_id = stable_id('deck', deck_name)
+    model_id = stable_id('model', model_name)
+
+    note_rows = []
+    card_rows = []
+    media_files = {}
+    seen = {}
+    for position, note in enumerate(notes):
+        fields = ['' if note.get(name) is None else str(note.get(name)) for name in FIELDS]
+        lemme = fields[0]
+
+        # a lemme can have several notes (le tour / la tour), the nth one always gets the same ids
+        occurrence = seen.get(lemme, 0)
+        seen[lemme] = occurrence + 1
+        key = f'{model_name}\x1f{lemme}\x1f{occurrence}'
+
+        note_id = stable_id('note', key)
+        note_rows.append((note_id, note_guid(key), model_id, now, -1, '', '\x1f'.join(fields), lemme,
+                          field_checksum(lemme), 0, ''))
+        # new card, due in learning order
+        card_rows.append((stable_id('card', key), note_id, deck_id, 0, now, -1, 0, 0, position + 1,
+                          0, 0, 0, 0, 0, 0, 0, 0, ''))
+
+        for file_name in SOUND_REF.findall(fields[FIELDS.index('Sound')]):
+            media_files.setdefault(file_name, os.path.join(media_dir, file_name))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        collection_path = os.path.join(tmp_dir, 'collection.anki2')
+        write_collection(collection_path, now, deck_id, deck_name, model_id, model_name, note_rows, card_rows)
+
+        with zipfile.ZipFile(package_path, 'w', zipfile.ZIP_DEFLATED) as package:
+            package.write(collection_path, 'collection.anki2')
+
+            # ZipFile.write copies in blocks, a clip is never read into memory whole.
+            # mp3s are already compressed so just store them
+            media_index = {}
+            for file_name, path in media_files.items():
+                if not os.path.exists(path):
+                    print(f'Missing media, skipped: {path}')
+                    continue
+                entry = str(len(media_index))
+                media_index[entry] = file_name
+                package.write(path, entry, compress_type=zipfile.ZIP_STORED)
+
+            package.writestr('media', json.dumps(media_index))
+
+    return len(note_rows), len(media_index)
+
+
+def write_collection(path, now, deck_id, deck_name, model_id, model_name, note_rows, card_rows):
+    db = sqlite3.connect(path)
+    try:
+        db.executescript(SCHEMA)
+        # one transaction for everything
+        with db:
+            db.execute('INSERT INTO col VALUES (1, ?, ?, ?, 11, 0, 0, 0, ?, ?, ?, ?, ?)',
+                       (now - now % 86400, now * 1000, now * 1000, json.dumps(collection_conf(deck_id, model_id)),
+                        json.dumps({str(model_id): note_type(model_id, model_name, deck_id, now)}),
+                        json.dumps(decks(deck_id, deck_name, now)), json.dumps(deck_confs()), '{}'))
+            db.executemany('INSERT INTO notes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', note_rows)
+            db.executemany('INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', card_rows)
+    finally:
+        db.close()
+
+
+def stable_id(kind, name) -> int:
+    # positive and comfortably inside a signed 64 bit int, the same every run
+    return int.from_bytes(hashlib.sha256(f'{kind}\x1f{name}'.encode('utf-8')).digest()[:7], 'big') + 1
+
+
+def note_guid(key) -> str:
+    return hashlib.sha256(f'guid\x1f{key}'.encode('utf-8')).hexdigest()[:20]
+
+
+def field_checksum(text) -> int:
+    # what Anki uses to spot duplicates: the first 8 hex digits of the sort field's sha1
+    return int(hashlib.sha1(re.sub(r'<[^>]+>', '', text).encode('utf-8')).hexdigest()[:8], 16)
+
+
+def note_type(model_id, model_name, deck_id, now) -> dict:
+    return {
+        'id': model_id, 'name': model_name, 'type': 0, 'mod': now, 'usn': -1, 'sortf': 0, 'did': deck_id,
+        'tmpls': [{'name': 'Card 1', 'ord': 0, 'qfmt': FRONT, 'afmt': BACK, 'did': None, 'bqfmt': '', 'bafmt': ''}],
+        'flds': [{'name': name, 'ord': ord_, 'sticky': False, 'rtl': False, 'font': 'Arial', 'size': 20, 'media': []}
+                 for ord_, name in enumerate(FIELDS)],
+        'css': CSS,
+        'latexPre': '\\documentclass[12pt]{article}\n\\special{papersize=3in,5in}\n\\usepackage[utf8]{inputenc}\n'
+                    '\\usepackage{amssymb,amsmath}\n\\pagestyle{empty}\n\\setlength{\\parindent}{0in}\n'
+                    '\\begin{document}\n',
+        'latexPost': '\\end{document}',
+        'latexsvg': False,
+        'req': [[0, 'any', [0]]],
+        'tags': [],
+        'vers': [],
+    }
+
+
+def decks(deck_id, deck_name, now) -> dict:
+    def deck(id_, name):
+        return {'id': id_, 'name': name, 'desc': '', 'mod': now, 'usn': -1, 'collapsed': False,
+                'browserCollapsed': False, 'newToday': [0, 0], 'revToday': [0, 0], 'lrnToday': [0, 0],
+                'timeToday': [0, 0], 'dyn': 0, 'conf': 1, 'extendNew': 10, 'extendRev': 50}
+
+    return {'1': deck(1, 'Default'), str(deck_id): deck(deck_id, deck_name)}
+
+
+def deck_confs() -> dict:
+    return {'1': {
+        'id': 1, 'name': 'Default', 'mod': 0, 'usn': 0, 'maxTaken': 60, 'autoplay': True, 'timer': 0,
+        'replayq': True, 'dyn': False,
+        'new': {'delays': [1, 10], 'ints': [1, 4, 7], 'initialFactor': 2500, 'separate': True, 'order': 1,
+                'perDay': 20, 'bury': True},
+        'rev': {'perDay': 200, 'ease4': 1.3, 'fuzz': 0.05, 'minSpace': 1, 'ivlFct': 1, 'maxIvl': 36500,
+                'bury': True},
+        'lapse': {'delays': [10], 'mult': 0, 'minInt': 1, 'leechFails': 8, 'leechAction': 0},
+    }}
+
+
+def collection_conf(deck_id, model_id) -> dict:
+    return {'activeDecks': [deck_id], 'curDeck': deck_id, 'curModel': model_id, 'newSpread': 0,
+            'collapseTime': 1200, 'timeLim': 0, 'estTimes': True, 'dueCounts': True, 'nextPos': 1,
+            'sortType': 'noteFld', 'sortBackwards': False, 'addToCur': True}
@@ -0,0 +1,145 @@
+"""
+On-disk cache of pronunciation clips so rebuilding decks never downloads the same audio twice.
+
+Clips are stored under the sha256 of their bytes (cache_dir/ab/ab12....mp3), so the same recording
+fetched for two words is kept once. An SQLite index maps (word, accent, source) -> clip and keeps each
+clip's size and last access time. Once the clips add up to more than max_bytes the least recently used
+ones are deleted.
+
+    python audio_cache.py "Freq 1 - 500.csv" --cache-dir ... [--accent FRA] [--source https://apifree.forvo.com]
+prints how many of a chunk's lemmes already have audio.
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+INDEX_NAME = 'index.sqlite'
+CLIP_EXT = '.mp3'
+
+
+class AudioCache:
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._db = sqlite3.connect(os.path.join(cache_dir, INDEX_NAME))
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS clips (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS words (
+                word TEXT NOT NULL,
+                accent TEXT NOT NULL,
+                source TEXT NOT NULL,
+                speaker TEXT NOT NULL,
+                digest TEXT NOT NULL REFERENCES clips (digest),
+                PRIMARY KEY (word, accent, source)
+            );
+            CREATE INDEX IF NOT EXISTS words_digest ON words (digest);
+        ''')
+
+    def get(self, word, accent='', source=''):
+        """Path of the word's clip, or None."""
+        return self.lookup([word], accent, source).get(word)
+
+    def lookup(self, words, accent='', source='') -> dict:
+        """word -> clip path for every one of words that's cached, marking those clips as just used."""
+        found = {}
+        words = list(dict.fromkeys(words))
+        # in batches, sqlite caps how many ? a query can have
+        for i in range(0, len(words), 500):
+            batch = words[i : i + 500]
+            rows = self._db.execute(
+                f'SELECT word, digest FROM words WHERE accent = ? AND source = ? '
+                f'AND word IN ({",".join("?" * len(batch))})', [accent, source, *batch])
+            found.update(rows)
+
+        now = time.time()
+        self._db.executemany('UPDATE clips SET last_access = ? WHERE digest = ?',
+                             [(now, digest) for digest in set(found.values())])
+        self._db.commit()
+        return {word: self.clip_path(digest) for word, digest in found.items()}
+
+    def put(self, word, data, accent='', source='', speaker='') -> str:
+        """Store a word's clip and return its path. Evicts old clips if that takes us over max_bytes."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.clip_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write then rename so a killed run never leaves half a clip behind
+            with open(f'{path}.part', 'wb') as f:
+                f.write(data)
+            os.replace(f'{path}.part', path)
+
+        self._db.execute('INSERT OR REPLACE INTO clips VALUES (?, ?, ?)', (digest, len(data), time.time()))
+        self._db.execute('INSERT OR REPLACE INTO words VALUES (?, ?, ?, ?, ?)', (word, accent, source, speaker, digest))
+        self._db.commit()
+
+        self.evict(keep=digest)
+        return path
+
+    def evict(self, keep=None):
+        """Delete least recently used clips (and the words pointing at them) until we're within max_bytes."""
+        total = self.size()
+        if total <= self.max_bytes:
+            return
+
+        for digest, size in self._db.execute('SELECT digest, size FROM clips ORDER BY last_access').fetchall():
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            self._db.execute('DELETE FROM words WHERE digest = ?', (digest,))
+            self._db.execute('DELETE FROM clips WHERE digest = ?', (digest,))
+            if os.path.exists(self.clip_path(digest)):
+                os.remove(self.clip_path(digest))
+            total -= size
+        self._db.commit()
+
+    def size(self) -> int:
+        return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM clips').fetchone()[0]
+
+    def clip_path(self, digest) -> str:
+        return os.path.join(self.cache_dir, digest[:2], f'{digest}{CLIP_EXT}')
+
+    def close(self):
+        self._db.close()
+
+
+def hydrate(cache, chunk_csv, accent='', source='') -> (dict, list):
+    """
+    Check a 'Freq X - Y.csv' chunk's lemmes against the cache in one go.
+    Returns ({lemme: clip path} for the cached ones, [lemmes still to fetch]).
+    """
+    lemmes = pd.read_csv(chunk_csv, usecols=['lemme'], dtype={'lemme': str}, keep_default_na=False)['lemme']
+    lemmes = list(dict.fromkeys(lemmes))
+    cached = cache.lookup(lemmes, accent, source)
+    return cached, [lemme for lemme in lemmes if lemme not in cached]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show which of a chunk's lemmes already have cached audio.")
+    parser.add_argument('chunk_csv')
+    parser.add_argument('--cache-dir', required=True)
+    parser.add_argument('--accent', default='')
+    parser.add_argument('--source', default='')
+    args = parser.parse_args()
+
+    cache = AudioCache(args.cache_dir, float('inf'))
+    cached, missing = hydrate(cache, args.chunk_csv, args.accent, args.source)
+    cache.close()
+
+    print(f'{len(cached)} lemmes cached, {len(missing)} to fetch')
+    for lemme in missing:
+        print(f'\t{lemme}')
+
+
+if __name__ == '__main__':
+    main()
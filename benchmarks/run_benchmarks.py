@@ -0,0 +1,170 @@
+"""
+Time each step of the pipeline on synthetic lexiques (see synthetic_lexique.py) and save the timings as JSON.
+
+    python benchmarks/run_benchmarks.py                                  # 10k and 140k rows
+    python benchmarks/run_benchmarks.py --rows 10000 140000 1000000 --repeat 3 --output bench.json
+    python benchmarks/run_benchmarks.py --baseline bench.json            # also flag anything slower than last time
+
+Steps timed, each on the output of the one before:
+    read_lexique                stage 1 reading the .csv and applying the filter rules
+    filter_df_for_highest_pos   stage 1 keeping each lemme's best POS
+    chunk_loop                  stage 2 clean_input + make_chunks
+    lemme_index                 grouping every chunk's rows by lemme (LemmeIndex, what group_rows_by_lemme became)
+    format_loop                 stage 3 format_decks over every chunk, no workers, no cache, nothing written
+
+Every step runs --repeat times, best and median are reported. The JSON also records the python / pandas /
+numpy versions and the machine so runs from different setups can be told apart.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lemme_index import LemmeIndex  # noqa: E402
+from stages import load_stage  # noqa: E402
+from synthetic_lexique import make_lexique  # noqa: E402
+
+DEFAULT_ROWS = [10_000, 140_000]
+REGRESSION_TOLERANCE = 0.20  # --baseline flags steps this much slower than before
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline stages on synthetic lexiques.')
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS, help='lexique sizes to run')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per step')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='earlier results to compare against')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help='slowdown (0.2 = 20%%) that counts as a regression')
+    args = parser.parse_args()
+
+    results = []
+    for n_rows in args.rows:
+        print(f'\n=== {n_rows} rows')
+        results.extend(run_benchmarks(n_rows, args.repeat, args.seed))
+
+    report = {'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+              'environment': environment(),
+              'repeat': args.repeat,
+              'seed': args.seed,
+              'results': results}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nWrote {args.output}')
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(json.load(f)['results'], results, args.tolerance)
+        if regressions:
+            sys.exit(1)
+
+
+def run_benchmarks(n_rows, repeat, seed) -> list:
+    """Time every step on an n_rows lexique. Returns one result dict per step."""
+    lexique_filter = load_stage(1)
+    make_little_csvs = load_stage(2)
+    anki_format = load_stage(3)
+
+    results = []
+
+    def bench(step, func, rows_in):
+        output, seconds = timed(func, repeat)
+        result = {'rows': n_rows, 'step': step, 'rows_in': rows_in, 'rows_out': count_rows(output),
+                  'seconds': seconds, 'best': min(seconds), 'median': statistics.median(seconds)}
+        results.append(result)
+        print(f'\t{step:<28}{result["best"]:9.3f}s best  {result["median"]:9.3f}s median')
+        return output
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # stage 1 reads a .csv, so go through one like the real thing does
+        lexique_path = os.path.join(tmp_dir, 'Lexique383.csv')
+        make_lexique(n_rows, seed).to_csv(lexique_path, index=False, encoding='utf-8')
+        filtered = bench('read_lexique', lambda: lexique_filter.read_lexique(lexique_path), n_rows)
+
+    df = bench('filter_df_for_highest_pos', lambda: lexique_filter.filter_df_for_highest_pos(filtered), len(filtered))
+
+    chunks = bench('chunk_loop', lambda: list(make_little_csvs.make_chunks(make_little_csvs.clean_input(df))), len(df))
+    chunk_rows = sum(len(chunk_df) for _, _, chunk_df in chunks)
+
+    bench('lemme_index', lambda: [LemmeIndex(chunk_df) for _, _, chunk_df in chunks], chunk_rows)
+
+    def format_loop():
+        decks = []
+        # format_decks prints every formatting exception, that's not what's being timed
+        with contextlib.redirect_stdout(io.StringIO()):
+            for chunk_start, _, chunk_df in chunks:
+                decks.extend(export_df for _, _, export_df in anki_format.format_decks(chunk_df, chunk_start))
+        return decks
+
+    bench('format_loop', format_loop, chunk_rows)
+    return results
+
+
+def timed(func, repeat) -> (object, list):
+    """func()'s result and the wall time of each of repeat calls."""
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = func()
+        seconds.append(time.perf_counter() - started)
+    return output, seconds
+
+
+def count_rows(output) -> int:
+    """Rows in a step's output: a DataFrame, a list of (start, end, DataFrame) chunks, or a list of frames."""
+    if isinstance(output, pd.DataFrame):
+        return len(output)
+    frames = [item[2] if isinstance(item, tuple) else item for item in output]
+    return sum(len(frame) for frame in frames if isinstance(frame, pd.DataFrame))
+
+
+def environment() -> dict:
+    try:
+        import pyarrow
+        pyarrow_version = pyarrow.__version__
+    except ImportError:
+        pyarrow_version = None
+
+    return {'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'pyarrow': pyarrow_version,
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+            'cpu_count': os.cpu_count()}
+
+
+def compare(baseline, results, tolerance) -> list:
+    """Print how each step's best time moved since baseline. Returns the steps that got slower than tolerance."""
+    before = {(result['rows'], result['step']): result['best'] for result in baseline}
+    regressions = []
+    print('\nAgainst baseline:')
+    for result in results:
+        key = (result['rows'], result['step'])
+        if key not in before:
+            continue
+        change = result['best'] / before[key] - 1 if before[key] else 0.0
+        flag = ''
+        if change > tolerance:
+            regressions.append(key)
+            flag = '  <-- slower'
+        print(f'\t{result["rows"]:>9} {result["step"]:<28}{before[key]:9.3f}s -> {result["best"]:9.3f}s '
+              f'({change:+.0%}){flag}')
+    return regressions
+
+
+if __name__ == '__main__':
+    main()
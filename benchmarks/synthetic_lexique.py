@@ -0,0 +1,212 @@
+"""
+Synthetic Lexique383.csv for benchmarking, so nobody needs the real file (or its licence) to time the pipeline.
+
+Same 35 columns as the real export, sorted by ortho like it is. Lemmes come in groups of 1-5 rows
+(a NOM is mostly s/p, an ADJ mostly ms/mp/fs/fp, a VER a handful of forms), some lemmes show up under
+several POS, genre/nombre go missing at about the real rates and the POS mix is close to the real one,
+non-whitelisted POS included. The hard coded lemmes (quelque, fois, tout, ...) and blocklisted junk
+(FALSE, zzz, ...) are in there too so every branch gets exercised.
+
+Everything is drawn with numpy from one seed: same seed and row count, same file.
+
+    python benchmarks/synthetic_lexique.py 140000 [--seed 0] [--out Lexique383.csv]
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['1_ortho', '2_phon', '3_lemme', '4_cgram', '5_genre', '6_nombre', '7_freqlemfilms2', '8_freqlemlivres',
+           '9_freqfilms2', '10_freqlivres', '11_infover', '12_nbhomogr', '13_nbhomoph', '14_islem', '15_nblettres',
+           '16_nbphons', '17_cvcv', '18_p_cvcv', '19_voisorth', '20_voisphon', '21_puorth', '22_puphon', '23_syll',
+           '24_nbsyll', '25_cv-cv', '26_orthrenv', '27_phonrenv', '28_orthosyll', '29_cgramortho', '30_deflem',
+           '31_defobs', '32_old20', '33_pld20', '34_morphoder', '35_nbmorph']
+
+# share of lemme groups per POS, roughly Lexique383's
+POS_MIX = {'NOM': 0.42, 'VER': 0.28, 'ADJ': 0.19, 'ADV': 0.035, 'ONO': 0.01, 'PRE': 0.004, 'CON': 0.003,
+           'ADJ:ind': 0.003, 'ADJ:num': 0.01, 'PRO:per': 0.01, 'PRO:ind': 0.01, 'ART:def': 0.005,
+           'AUX': 0.005, 'LIA': 0.005}
+
+# chance of a group having 1..5 rows, per POS. anything not listed is OTHER_SIZES
+GROUP_SIZES = {'NOM': [0.35, 0.50, 0.05, 0.08, 0.02],
+               'ADJ': [0.20, 0.30, 0.15, 0.30, 0.05],
+               'VER': [0.15, 0.20, 0.20, 0.20, 0.25]}
+OTHER_SIZES = [0.90, 0.10, 0.0, 0.0, 0.0]
+
+# (genre, nombre) of a NOM/ADJ group's kth row, by group size. '' is missing
+NOMINAL_FORMS = {1: [('m', 's')],
+                 2: [('m', 's'), ('m', 'p')],
+                 3: [('m', 's'), ('m', 'p'), ('f', 's')],
+                 4: [('m', 's'), ('m', 'p'), ('f', 's'), ('f', 'p')],
+                 5: [('m', 's'), ('m', 'p'), ('f', 's'), ('f', 'p'), ('m', 'p')]}
+NOMINAL_ENDINGS = {1: [''], 2: ['', 's'], 3: ['', 's', 'e'], 4: ['', 's', 'e', 'es'], 5: ['', 's', 'e', 'es', 'x']}
+VERB_ENDINGS = ['', 'a', 'ait', 'ent', 'ons']
+
+GENRE_NAN_RATE = 0.05  # on top of VER / ADV / ... which never have one
+NOMBRE_NAN_RATE = 0.03
+FEMININE_RATE = 0.35  # single gender nouns that are f
+SHARED_LEMME_RATE = 0.12  # groups whose lemme also has a group under another POS
+ZERO_FREQ_RATE = 0.12
+
+# real lemmes stage 3 special cases, and junk the filter rules drop
+SPECIAL_LEMMES = ['quelque', 'quelques', 'fois', 'tout', 'toute', 'aucun', 'FALSE', 'TRUE', 'zzz', 'o', 'team', '58e']
+
+ONSETS = ['', '', '', 'a', 'é', 'i', 'o', 'u', 'ha', 'hé']  # vowel (or h) starts get elided headers
+CONSONANTS = list('bcdfglmnprstv')
+VOWEL_SOUNDS = ['a', 'e', 'i', 'o', 'u', 'é', 'è', 'ou', 'an', 'on']
+SYLLABLES = [c + v for c in CONSONANTS for v in VOWEL_SOUNDS]
+WORD_ENDINGS = ['', '', 'e', 'er', 'on', 'eau', 'ir', 'ant']
+
+# str.translate tables, far quicker than regexes over a million rows
+PHON_LETTERS = str.maketrans({'é': 'e', 'è': 'E', 'h': None})
+CV_LETTERS = str.maketrans({**dict.fromkeys('aeiouyéèêâîôûàE', 'V'),
+                            **dict.fromkeys('bcdfghjklmnpqrstvwxzBCDFGHJKLMNPQRSTVWXZ0123456789', 'C')})
+
+
+def make_lexique(n_rows, seed=0) -> pd.DataFrame:
+    """n_rows of synthetic lexique, columns as in Lexique383.csv."""
+    rng = np.random.default_rng(seed)
+    pos_names = list(POS_MIX)
+
+    # draw groups until there are enough rows, the last one is cut short
+    n_groups = n_rows // 2 + 16
+    group_pos = rng.choice(len(pos_names), size=n_groups, p=np.array(list(POS_MIX.values())) / sum(POS_MIX.values()))
+    group_size = np.empty(n_groups, dtype=np.int64)
+    for code, pos in enumerate(pos_names):
+        at = group_pos == code
+        group_size[at] = rng.choice(5, size=at.sum(), p=GROUP_SIZES.get(pos, OTHER_SIZES)) + 1
+    n_groups = int(np.searchsorted(np.cumsum(group_size), n_rows)) + 1
+    group_pos, group_size = group_pos[:n_groups], group_size[:n_groups]
+    group_size[-1] -= group_size.sum() - n_rows
+
+    # each group's lemme. some groups reuse another's so a lemme can have several POS
+    word_id = np.arange(n_groups)
+    shared = rng.random(n_groups) < SHARED_LEMME_RATE
+    word_id[shared] = rng.integers(0, n_groups, size=shared.sum())
+    words = make_words(rng, n_groups)
+    words[:len(SPECIAL_LEMMES)] = SPECIAL_LEMMES[:n_groups]
+    group_lemme = words[word_id]
+
+    # group-level frequencies, heavy tailed with a good share of zeros
+    freq_films = np.round(rng.lognormal(0.0, 2.0, n_groups), 2) * (rng.random(n_groups) >= ZERO_FREQ_RATE)
+    freq_books = np.round(freq_films * rng.lognormal(0.0, 0.7, n_groups), 2) * (rng.random(n_groups) >= ZERO_FREQ_RATE)
+
+    # one entry per row from here on
+    group_of = np.repeat(np.arange(n_groups), group_size)
+    k = np.arange(n_rows) - np.repeat(np.cumsum(group_size) - group_size, group_size)
+    size = group_size[group_of]
+    pos_code = group_pos[group_of]
+    pos = np.array(pos_names, dtype=object)[pos_code]
+    lemme = group_lemme[group_of]
+
+    nominal = np.isin(pos, ['NOM', 'ADJ'])
+    verb = pos == 'VER'
+
+    # genre / nombre / ortho ending from the row's place in its group
+    genre = np.full(n_rows, '', dtype=object)
+    nombre = np.full(n_rows, '', dtype=object)
+    ending = np.full(n_rows, '', dtype=object)
+    for n, forms in NOMINAL_FORMS.items():
+        for i, (g, nb) in enumerate(forms):
+            at = nominal & (size == n) & (k == i)
+            genre[at], nombre[at], ending[at] = g, nb, NOMINAL_ENDINGS[n][i]
+
+    # single gender nouns, some feminine
+    feminine = (pos == 'NOM') & (size <= 2) & (rng.random(n_groups) < FEMININE_RATE)[group_of]
+    genre[feminine] = 'f'
+
+    ending[verb] = np.array(VERB_ENDINGS, dtype=object)[k[verb]]
+    nombre[verb & (k > 0)] = np.where(np.isin(k[verb & (k > 0)], [3, 4]), 'p', 's')
+
+    genre[nominal & (rng.random(n_rows) < GENRE_NAN_RATE)] = ''
+    nombre[nominal & (rng.random(n_rows) < NOMBRE_NAN_RATE)] = ''
+
+    ortho = pd.Series(lemme + ending, dtype=object)
+    phon = ortho.str.replace(r'(es|e|s|x|ent)$', '', regex=True).str.translate(PHON_LETTERS)
+    phon = phon.where(phon != '', ortho)
+    cvcv = ortho.str.translate(CV_LETTERS)
+    p_cvcv = phon.str.translate(CV_LETTERS)
+    orthosyll = hyphenate(ortho)
+    syll = hyphenate(phon)
+
+    share = rng.random(n_rows)
+    df = pd.DataFrame({
+        '1_ortho': ortho,
+        '2_phon': phon,
+        '3_lemme': lemme,
+        '4_cgram': pos,
+        '5_genre': genre,
+        '6_nombre': nombre,
+        '7_freqlemfilms2': freq_films[group_of],
+        '8_freqlemlivres': freq_books[group_of],
+        '9_freqfilms2': np.round(freq_films[group_of] * share, 2),
+        '10_freqlivres': np.round(freq_books[group_of] * share, 2),
+        '11_infover': np.where(verb, 'ind:pre:3s;', ''),
+        '12_nbhomogr': rng.integers(1, 4, n_rows),
+        '13_nbhomoph': rng.integers(1, 8, n_rows),
+        '14_islem': ((k == 0) & (rng.random(n_rows) < 0.97)).astype(np.int8),
+        '15_nblettres': ortho.str.len(),
+        '16_nbphons': phon.str.len(),
+        '17_cvcv': cvcv,
+        '18_p_cvcv': p_cvcv,
+        '19_voisorth': rng.integers(0, 20, n_rows),
+        '20_voisphon': rng.integers(0, 40, n_rows),
+        '21_puorth': ortho.str.len() + 1,
+        '22_puphon': phon.str.len() + 1,
+        '23_syll': syll,
+        '24_nbsyll': (ortho.str.len() + 1) // 2,
+        '25_cv-cv': hyphenate(cvcv),
+        '26_orthrenv': ortho.str[::-1],
+        '27_phonrenv': phon.str[::-1],
+        '28_orthosyll': orthosyll,
+        '29_cgramortho': pos,
+        '30_deflem': rng.integers(0, 101, n_rows),
+        '31_defobs': rng.integers(15, 30, n_rows),
+        '32_old20': np.round(rng.uniform(1.0, 4.0, n_rows), 2),
+        '33_pld20': np.round(rng.uniform(1.0, 4.0, n_rows), 2),
+        '34_morphoder': lemme,
+        '35_nbmorph': rng.integers(1, 4, n_rows),
+    }, columns=COLUMNS)
+
+    # missing values are empty cells in the real export
+    df = df.replace({'': np.nan})
+
+    # the real file is sorted by ortho, which interleaves lemmes and POS
+    return df.sort_values('1_ortho', kind='stable').reset_index(drop=True)
+
+
+def hyphenate(values) -> list:
+    """Split into two letter 'syllables': maison -> ma-is-on. Close enough for timing."""
+    return ['-'.join(value[i : i + 2] for i in range(0, len(value), 2)) for value in values]
+
+
+def make_words(rng, n) -> np.ndarray:
+    """n distinct made-up words: an optional vowel onset, the index spelled in syllables, an ending."""
+    base = len(SYLLABLES)
+    # +base so every word has at least two syllables and passes the min length rule
+    ids = np.arange(n) + base
+    stems = np.full(n, '', dtype=object)
+    syllables = np.array(SYLLABLES, dtype=object)
+    while (ids > 0).any():
+        left = ids > 0
+        stems[left] = syllables[ids[left] % base] + stems[left]
+        ids //= base
+
+    onsets = np.array(ONSETS, dtype=object)[rng.integers(0, len(ONSETS), n)]
+    endings = np.array(WORD_ENDINGS, dtype=object)[rng.integers(0, len(WORD_ENDINGS), n)]
+    return onsets + stems + endings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic Lexique383.csv.')
+    parser.add_argument('rows', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='Lexique383.csv')
+    args = parser.parse_args()
+
+    make_lexique(args.rows, args.seed).to_csv(args.out, index=False, encoding='utf-8')
+    print(f'Wrote {args.rows} rows to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Build manifest so a re-run only rewrites the output files whose inputs actually changed.
+
+Each output folder gets a build_manifest.json mapping output file name -> hash of what went into it
+(the input rows, the config that shapes the output and, for decks, a formatting rules version).
+A stage hashes the inputs for a file first and skips it when the manifest already has that hash and
+the file still exists. Delete build_manifest.json to force a full rebuild.
+"""
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+MANIFEST_NAME = 'build_manifest.json'
+
+
+class BuildManifest:
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.hashes = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                self.hashes = json.load(f)
+
+    def is_current(self, output_path, input_hash) -> bool:
+        return os.path.exists(output_path) and self.hashes.get(os.path.basename(output_path)) == input_hash
+
+    def record(self, output_path, input_hash):
+        """Call once output_path has been written."""
+        self.hashes[os.path.basename(output_path)] = input_hash
+
+        # saved every time so a crash part way through a run keeps what finished
+        self._save()
+
+    def forget(self, names):
+        """Drop the entries for these file names, e.g. files a run no longer writes."""
+        for name in names:
+            self.hashes.pop(name, None)
+        self._save()
+
+    def _save(self):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.hashes, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def input_hash(df=None, config=None) -> str:
+    """Hash of a DataFrame's column names and values (index ignored) plus a json-serialisable config."""
+    digest = hashlib.sha256()
+    if df is not None:
+        digest.update(json.dumps([str(col) for col in df.columns]).encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    digest.update(json.dumps(config, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
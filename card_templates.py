@@ -0,0 +1,75 @@
+"""
+Layouts of stage 3's 'Noun Declension' field.
+
+Each layout is bound to str.format once at import, so a formatter just picks one and fills it in:
+    NOM_MASC(lemme='livre', pl='livres')
+Fields: header = the lemme's header from bold_headers(), lemme = the bare lemme,
+the rest are the forms (s, pl, m, f, ms, mpl, fs, fpl).
+
+fill() does the same for many lemmes at once: fill(NOM_MASC, lemme=lemmes, pl=plurals).
+
+The odd spacing in NOUN_FOUR is what existing decks have, keep it unless you want every deck reimported.
+"""
+import re
+import string
+
+import numpy as np
+
+VOWELS = 'aeiouhâàéèêëïîôùûü'
+
+# first letters that elide, either case. matched as is, str.lower() isn't always one char to one char
+ELIDING_LETTERS = sorted(set(VOWELS) | {v.upper() for v in VOWELS if v.upper().lower() == v})
+ARTICLED = re.compile(r'(le|la) (\S+)')
+
+# header only
+BOLD = '{header}'.format
+
+# nouns
+NOM_PLURAL_ONLY = '<b>les {pl}</b>'.format
+NOM_MASC = '<b><blue>le {lemme}</blue></b> [<gr><i>pl. </i></gr><blue>les {pl}</blue>]'.format
+NOM_FEM = '<b><red>la {lemme}</red></b> [<gr><i>pl. </i></gr><red>les {pl}</red>]'.format
+NOM_MASC_FEM = ('<b><blue>le {lemme}</blue></b> [<gr><i>pl. </i></gr><blue>les {pl}</blue>; '
+                '<gr><i>f. </i></gr><red>la {f}</red>]').format
+NOUN_FOUR = ('{header} [<gr><i>ms. </i></gr> <blue>le {ms}</blue>; <gr><i>mpl. </i></gr> <blue>les {mpl}</blue>; '
+             '<gr><i>fs. </i></gr> <red>la {fs}</red>; <gr><i>fpl. </i></gr> <red>les {fpl}</red>]').format
+
+# adjectives
+ADJ_PLURAL = '{header} [<gr><i>pl. </i></gr>{pl}]'.format
+ADJ_MASC_PLURAL = '{header} [<gr><i>mpl. </i></gr><blue>{pl}</blue>]'.format
+ADJ_FEM_PLURAL = '{header} [<gr><i>fpl. </i></gr><red>{pl}</red>]'.format
+ADJ_SING_PLURAL = '{header} [<gr><i>s. </i></gr><blue>{s}</blue>; <gr><i>pl. </i></gr><blue>{pl}</blue>]'.format
+ADJ_MASC_PLURAL_FEM = ('{header} [<gr><i>m. </i></gr><blue>{m}</blue>; <gr><i>pl. </i></gr><blue>{pl}</blue>; '
+                       '<gr><i>f. </i></gr><red>{f}</red>]').format
+ADJ_FOUR = ('{header} [<gr><i>ms. </i></gr><blue>{ms}</blue>; <gr><i>mpl. </i></gr><blue>{mpl}</blue>; '
+            '<gr><i>fs. </i></gr><red>{fs}</red>; <gr><i>fpl. </i></gr><red>{fpl}</red>]').format
+
+
+def bold_headers(lemmes) -> list:
+    """
+    Every lemme's header at once: <b>lemme</b>, except 'le X' -> "l'X" and 'la X' -> "l'X (f)"
+    when X starts with a vowel (or h). Those lose the bold, same as decks always had.
+    """
+    lemmes = np.array([str(lemme) for lemme in lemmes] + [None], dtype=object)[:-1]
+    headers = '<b>' + lemmes + '</b>'
+
+    # only 'le X' / 'la X' can elide, few enough to go one by one
+    text = lemmes.astype(str)
+    for i in np.flatnonzero(np.char.startswith(text, 'le ') | np.char.startswith(text, 'la ')):
+        match = ARTICLED.fullmatch(lemmes[i])
+        if match and match.group(2)[0] in ELIDING_LETTERS:
+            headers[i] = "l'" + match.group(2) + ('' if match.group(1) == 'le' else ' (f)')
+    return headers.tolist()
+
+
+def fill(layout, **fields) -> np.ndarray:
+    """
+    layout (one of the above) filled in for every position of the equal length fields at once, as an object array.
+    Values go through str() like str.format does (a missing value gives 'nan' either way).
+    """
+    size = len(next(iter(fields.values())))
+    filled = np.full(size, '', dtype=object)
+    for literal, name, _, _ in string.Formatter().parse(layout.__self__):
+        filled = filled + literal
+        if name is not None:
+            filled = filled + np.asarray(fields[name], dtype=object).astype(str).astype(object)
+    return filled
@@ -0,0 +1,104 @@
+"""
+Stage 2's chunks as one Parquet file instead of a 'Freq X - Y.csv' per chunk.
+
+Every row of every chunk, in chunk order, plus three columns:
+    chunk_id    stage 2's chunk, 0 for the first
+    freq_rank   frequency index of the row's lemme, the X..Y the chunk's file name would have had
+    source      'spoken' or 'written', the ranking stage 2 took the lemme from
+
+Each chunk is its own row group and the rows are sorted by freq_rank, so the row groups' min/max statistics
+let a filter on chunk_id or freq_rank skip every row group that can't match (predicate pushdown):
+    read_dataset(path, chunk_ids=[3])
+    read_dataset(path, freq_range=(1001, 2000))
+    for start_idx, end_idx, chunk_df in iter_chunks(path): ...
+No file names to parse, and a different CHUNK_SIZE in stage 3 is just a different range.
+
+Needs pyarrow.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from lexique_schema import first_seen_codes
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+SOURCE_DTYPE = pd.CategoricalDtype(['spoken', 'written'])
+
+
+def build_dataset(chunks, spoken_counts) -> pd.DataFrame:
+    """
+    One frame out of stage 2's make_chunks() output.
+    spoken_counts[i] is how many of chunk i's lemmes (its first ones) came from the spoken ranking.
+    """
+    if not chunks:
+        return pd.DataFrame(columns=['chunk_id', 'freq_rank', 'source'])
+
+    chunk_ids, freq_ranks, written = [], [], []
+    for chunk_id, ((start_idx, _, chunk_df), spoken_count) in enumerate(zip(chunks, spoken_counts)):
+        # a chunk's rows are lemme by lemme in chunk order, so first-seen order is the lemme's place in the chunk
+        place, _ = first_seen_codes(chunk_df['lemme'])
+        chunk_ids.append(np.full(len(chunk_df), chunk_id, dtype=np.int32))
+        freq_ranks.append((start_idx + place).astype(np.int32))
+        written.append((place >= spoken_count).astype(np.int8))
+
+    # columns added once to the whole frame, an assign() per chunk costs more than the rest put together
+    return pd.concat([chunk_df for _, _, chunk_df in chunks], ignore_index=True).assign(
+        chunk_id=np.concatenate(chunk_ids),
+        freq_rank=np.concatenate(freq_ranks),
+        source=pd.Categorical.from_codes(np.concatenate(written), dtype=SOURCE_DTYPE))
+
+
+def write_dataset(df, path):
+    """Write build_dataset()'s frame to path, one row group per chunk."""
+    require_pyarrow()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    chunk_ids = df['chunk_id'].to_numpy()
+    bounds = np.flatnonzero(np.diff(chunk_ids, prepend=-1, append=-1)) if len(df) else np.zeros(1, dtype=np.intp)
+
+    # write then rename so a reader never sees half a file
+    tmp_path = f'{path}.tmp'
+    with pq.ParquetWriter(tmp_path, table.schema, compression='zstd') as writer:
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            writer.write_table(table.slice(start, end - start), row_group_size=end - start)
+    os.replace(tmp_path, path)
+
+
+def read_dataset(path, chunk_ids=None, freq_range=None, columns=None) -> pd.DataFrame:
+    """
+    Rows of the chunks in chunk_ids and/or with freq_rank in freq_range (first, last), both inclusive.
+    Only the row groups that can hold them are read.
+    """
+    require_pyarrow()
+    filters = []
+    if chunk_ids is not None:
+        filters.append(('chunk_id', 'in', [int(chunk_id) for chunk_id in chunk_ids]))
+    if freq_range is not None:
+        first, last = freq_range
+        filters.extend([('freq_rank', '>=', int(first)), ('freq_rank', '<=', int(last))])
+    return pq.read_table(path, columns=columns, filters=filters or None).to_pandas()
+
+
+def chunk_ranges(path) -> list:
+    """(chunk_id, start_idx, end_idx) for every chunk in the file, from its two integer columns only."""
+    ranks = read_dataset(path, columns=['chunk_id', 'freq_rank'])
+    ranges = ranks.groupby('chunk_id', sort=True)['freq_rank'].agg(['min', 'max'])
+    return [(int(chunk_id), int(start), int(end)) for chunk_id, start, end in ranges.itertuples()]
+
+
+def iter_chunks(path, chunk_ids=None):
+    """Yield (start_idx, end_idx, chunk_df) for every chunk (or those in chunk_ids), like make_chunks() does."""
+    wanted = None if chunk_ids is None else set(chunk_ids)
+    for chunk_id, start_idx, end_idx in chunk_ranges(path):
+        if wanted is None or chunk_id in wanted:
+            yield start_idx, end_idx, read_dataset(path, chunk_ids=[chunk_id])
+
+
+def require_pyarrow():
+    if pq is None:
+        raise SystemExit('The chunk dataset needs pyarrow: pip install pyarrow')
@@ -0,0 +1,75 @@
+"""
+Memo of stage 3's noun declensions so re-runs only format lemmes whose rows changed.
+
+The declension only depends on the lemme and its rows' (ortho, cgram, genre, nombre), so that is the key.
+Entries live in an in-process LRU and, if a db path is given, in an SQLite file that outlasts the run.
+Every entry is tagged with the formatter version it was made with, bumping the version makes the
+old entries misses (and the next put() overwrites them).
+"""
+import json
+import sqlite3
+from collections import OrderedDict
+
+
+class DeclensionCache:
+    def __init__(self, version, max_size=100_000, db_path=None):
+        self.version = version
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+
+        self._db = None
+        if db_path is not None:
+            self._db = sqlite3.connect(db_path)
+            self._db.execute('CREATE TABLE IF NOT EXISTS declension '
+                             '(signature TEXT PRIMARY KEY, version TEXT NOT NULL, entry TEXT NOT NULL)')
+
+    def get(self, signature):
+        """The entry put() under signature, or None."""
+        if signature in self._lru:
+            self._lru.move_to_end(signature)
+            self.hits += 1
+            return self._lru[signature]
+
+        entry = None
+        if self._db is not None:
+            found = self._db.execute('SELECT entry FROM declension WHERE signature = ? AND version = ?',
+                                     (signature, str(self.version))).fetchone()
+            if found is not None:
+                entry = json.loads(found[0])
+                self._remember(signature, entry)
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, signature, entry):
+        """entry has to be json-serialisable. Nothing is written to disk until commit()."""
+        self._remember(signature, entry)
+        if self._db is not None:
+            self._db.execute('INSERT OR REPLACE INTO declension VALUES (?, ?, ?)',
+                             (signature, str(self.version), json.dumps(entry)))
+
+    def commit(self):
+        if self._db is not None:
+            self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    def _remember(self, signature, entry):
+        self._lru[signature] = entry
+        self._lru.move_to_end(signature)
+        if len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+
+def declension_signature(lemme, rows) -> str:
+    """Normalised key for a lemme's LexRows, only the fields the formatters read."""
+    return json.dumps([lemme, [[r.ortho, r.cgram, r.genre, r.nombre] for r in rows]], ensure_ascii=False)
@@ -0,0 +1,107 @@
+"""
+Where the time (and memory) goes, gathered during a run and written out as one JSON report.
+
+    instruments = Instruments(trace_memory=True)
+    with instruments.section('chunk', rows_in=len(df)) as s:
+        chunks = ...
+        s['rows_out'] = ...
+    instruments.count('formatter_branch', 'noun_four')
+    instruments.fail('format', lemme='...', lines=[...])
+    instruments.write('report.json')
+
+Sections with the same name add up (calls, seconds, rows), peak memory is the highest seen. Sections can nest,
+the outer one's peak includes the inner ones'. Memory is what tracemalloc sees, so only this process:
+stage 3's worker processes aren't in it, and tracing slows python code down noticeably.
+
+Functions that take instruments=None use section() below so they run the same without them.
+"""
+import contextlib
+import json
+import os
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+
+class Instruments:
+    def __init__(self, trace_memory=False):
+        self.sections = {}
+        self.counts = defaultdict(Counter)
+        self.failures = []
+
+        # tracemalloc has one peak for the whole process, nested sections take turns with it
+        self._started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        self._open_peaks = []
+
+    @contextlib.contextmanager
+    def section(self, name, rows_in=None):
+        """
+        Time the with block under name. Yields a dict, set its 'rows_out' (and 'rows_in' if not known up front).
+        """
+        record = {'rows_in': rows_in, 'rows_out': None}
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # the enclosing section keeps the peak so far, we get a fresh one
+            if self._open_peaks:
+                self._open_peaks[-1] = max(self._open_peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._open_peaks.append(0)
+
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - started
+            peak = None
+            if tracing:
+                peak = max(self._open_peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if self._open_peaks:
+                    self._open_peaks[-1] = max(self._open_peaks[-1], peak)
+            self._add(name, seconds, peak, record)
+
+    def _add(self, name, seconds, peak, record):
+        totals = self.sections.setdefault(name, {'calls': 0, 'seconds': 0.0, 'peak_bytes': None,
+                                                 'rows_in': None, 'rows_out': None})
+        totals['calls'] += 1
+        totals['seconds'] += seconds
+        if peak is not None:
+            totals['peak_bytes'] = max(totals['peak_bytes'] or 0, peak)
+        for key in ('rows_in', 'rows_out'):
+            if record.get(key) is not None:
+                totals[key] = (totals[key] or 0) + int(record[key])
+
+    def count(self, group, key, n=1):
+        self.counts[group][key] += n
+
+    def fail(self, group, **details):
+        """Keep a failure for the report instead of printing it."""
+        self.failures.append({'group': group, **details})
+
+    def report(self) -> dict:
+        return {'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'trace_memory': tracemalloc.is_tracing(),
+                'sections': self.sections,
+                'counts': {group: dict(counts.most_common()) for group, counts in self.counts.items()},
+                'failure_count': len(self.failures),
+                'failures': self.failures}
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2, ensure_ascii=False)
+
+    def close(self):
+        """Stop tracemalloc if we started it."""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+
+def section(instruments, name, rows_in=None):
+    """instruments.section(), or a do-nothing stand in when instruments is None."""
+    if instruments is None:
+        return contextlib.nullcontext({})
+    return instruments.section(name, rows_in)
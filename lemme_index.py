@@ -0,0 +1,58 @@
+"""
+Row lookup by lemme, shared by stages 2 and 3.
+
+Built once per DataFrame with factorize + a stable argsort so each lemme's rows sit in one
+contiguous slice. An encoded lemme column (see lexique_schema.py) is factorized on its integer
+codes. Lemmes keep the order they're first seen in and each lemme's rows keep frame order,
+which is what the chunking and the formatters rely on.
+"""
+import numpy as np
+import pandas as pd
+
+from lexique_schema import first_seen_codes
+
+
+class LemmeIndex:
+    def __init__(self, df, column='lemme'):
+        codes, uniques = first_seen_codes(df[column])
+
+        # unique lemmes in first-seen order
+        self.lemmes = list(uniques)
+
+        # positions of df's rows, grouped by lemme
+        self.order = np.argsort(codes, kind='stable')
+
+        # df with each lemme's rows made contiguous. lemme i is grouped.iloc[bounds[i]:bounds[i + 1]]
+        self.grouped = df.iloc[self.order]
+        self.bounds = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(uniques)))))
+
+        self._code_of = {lemme: code for code, lemme in enumerate(self.lemmes)}
+
+    def __len__(self):
+        return len(self.lemmes)
+
+    def __contains__(self, lemme):
+        return lemme in self._code_of
+
+    def __iter__(self):
+        """Yield (lemme, rows DataFrame) in first-seen order."""
+        for code, lemme in enumerate(self.lemmes):
+            yield lemme, self.grouped.iloc[self.bounds[code]:self.bounds[code + 1]]
+
+    def slice(self, lemme) -> slice:
+        """Slice of self.grouped holding the lemme's rows."""
+        code = self._code_of[lemme]
+        return slice(self.bounds[code], self.bounds[code + 1])
+
+    def rows(self, lemme) -> pd.DataFrame:
+        """All rows for a lemme, in frame order."""
+        return self.grouped.iloc[self.slice(lemme)]
+
+    def sizes(self, lemmes) -> np.ndarray:
+        """Number of rows of each of the given lemmes."""
+        codes = np.array([self._code_of[lemme] for lemme in lemmes], dtype=np.intp)
+        return self.bounds[codes + 1] - self.bounds[codes]
+
+    def positions(self, lemmes) -> np.ndarray:
+        """Positions in the original frame of every row for the given lemmes, lemme by lemme."""
+        return np.concatenate([self.order[self.slice(lemme)] for lemme in lemmes] or [np.empty(0, dtype=np.intp)])
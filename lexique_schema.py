@@ -0,0 +1,87 @@
+"""
+The encoded form the stages hand the lexique around in, so grouping and ranking work on integers.
+
+    lemme    category: integer codes into a vocabulary of every lemme (the categories), int32 at full size
+    cgram    category: codes into the whitelisted POS, in priority order, so a code's rank is a table lookup
+    genre    category ['f', 'm']
+    nombre   category ['p', 's']
+
+Missing values are code -1. Categoricals decode back to the same strings on to_csv() and hash to the
+same values in build_manifest.input_hash(), so neither the .csv files nor the manifests change.
+
+The numeric columns are NUMERIC_DTYPES, in stage 1's frame and in anything read back from its .csv alike:
+float32 hashes differently from the float64 read_csv() would give the same text.
+"""
+import numpy as np
+import pandas as pd
+
+SCHEMA_VERSION = 2
+
+GENRE_DTYPE = pd.CategoricalDtype(['f', 'm'])
+NOMBRE_DTYPE = pd.CategoricalDtype(['p', 's'])
+NUMERIC_DTYPES = {'freqlemfilms': np.float32, 'freqlemlivres': np.float32, 'islem': np.int8}
+
+
+def pos_dtype(pos_priority) -> pd.CategoricalDtype:
+    return pd.CategoricalDtype(list(pos_priority))
+
+
+def pos_rank_table(pos_categories, pos_priority) -> np.ndarray:
+    """
+    Rank (0 = best) of every cgram code, indexed as table[codes].
+    The extra last entry is what code -1 (missing or not in pos_priority) lands on, it ranks last.
+    """
+    worst = len(pos_priority)
+    rank_of = {pos: rank for rank, pos in enumerate(pos_priority)}
+    return np.array([rank_of.get(pos, worst) for pos in pos_categories] + [worst], dtype=np.int8)
+
+
+def encode_lemmes(lemmes) -> pd.Series:
+    """Lemmes as str categories, the way stage 2 always had them (astype(str)). Already encoded ones pass through."""
+    if (isinstance(lemmes.dtype, pd.CategoricalDtype) and lemmes.cat.categories.inferred_type in ('string', 'empty')
+            and not (lemmes.cat.codes == -1).any()):
+        return lemmes
+    return lemmes.astype(str).astype('category')
+
+
+def first_seen_codes(values) -> (np.ndarray, object):
+    """
+    int32 code per value numbering values in the order they're first seen, plus the values in that order.
+    Categoricals get there by factorizing their integer codes, no strings hashed.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, vocab_codes = pd.factorize(values.cat.codes.to_numpy())
+        uniques = pd.Categorical.from_codes(vocab_codes, dtype=values.dtype)
+    else:
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return codes.astype(np.int32), uniques
+
+
+def categorical_from_codes(codes, uniques) -> pd.Categorical:
+    """
+    Encode values from first_seen_codes() without hashing them again: uniques become the categories
+    (first-seen order) and a missing unique becomes code -1.
+    """
+    uniques = pd.Index(uniques)
+    missing = uniques.isna()
+    if not missing.any():
+        return pd.Categorical.from_codes(codes, categories=uniques)
+    remap = np.where(missing, -1, np.cumsum(~missing) - 1).astype(np.int32)
+    return pd.Categorical.from_codes(remap[codes], categories=uniques[~missing])
+
+
+def encode(df, pos_priority=None) -> pd.DataFrame:
+    """
+    df with lemme / cgram / genre / nombre encoded (those of them it has). cgram gets pos_priority's
+    categories if given, anything outside it becomes missing, so only pass it for filtered rows.
+    """
+    columns = {}
+    if 'lemme' in df:
+        columns['lemme'] = encode_lemmes(df['lemme'])
+    if 'cgram' in df:
+        columns['cgram'] = df['cgram'].astype(pos_dtype(pos_priority) if pos_priority is not None else 'category')
+    if 'genre' in df:
+        columns['genre'] = df['genre'].astype(GENRE_DTYPE)
+    if 'nombre' in df:
+        columns['nombre'] = df['nombre'].astype(NOMBRE_DTYPE)
+    return df.assign(**columns)
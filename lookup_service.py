@@ -0,0 +1,236 @@
+"""
+Cards for any lemmes on demand, without running the pipeline.
+
+Opens stage 1's filtered lexique through its offset index (see offset_index.py) rather than loading all of it:
+a lookup parses just the asked lemmes' rows out of the .csv and runs stage 3's format_lemme() on them, with an
+LRU of finished cards in front, so the cards are exactly what the decks get.
+
+In process:
+    service = LookupService('Lexique383 - Filtered.csv')
+    service.lookup(['maison', 'chat'])   # {'cards': [{Lemme, Noun Declension, Pronunciation, POS}, ...], 'missing': []}
+    service.stats()                      # request count, cache hits, p50/p99 latency, throughput
+
+Command line:
+    python lookup_service.py maison chat                 # print their cards
+    python lookup_service.py --serve [--port 8765]       # local HTTP server:
+        GET  /cards?lemme=maison&lemme=chat
+        POST /cards  {"lemmes": ["maison", "chat"]}
+        GET  /stats
+"""
+import argparse
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import card_templates as tpl
+from offset_index import OffsetReader
+from pronunciation import pronunciations
+from stages import load_stage
+
+CARD_FIELDS = ['Lemme', 'Noun Declension', 'Pronunciation', 'POS']
+CACHE_SIZE = 10_000  # lemmes whose cards are kept
+LATENCY_WINDOW = 10_000  # latest requests the percentiles are over
+DEFAULT_PORT = 8765
+
+
+class LookupService:
+    def __init__(self, csv_path=None, cache_size=CACHE_SIZE):
+        """csv_path defaults to stage 1's output_file_path."""
+        self._format = load_stage(3)
+        if csv_path is None:
+            csv_path = load_stage(1).output_file_path
+        self.csv_path = csv_path
+
+        started = time.perf_counter()
+        # only the lemmes' byte ranges are loaded, rows get parsed as they're asked for
+        self._reader = OffsetReader(csv_path)
+        self.load_seconds = time.perf_counter() - started
+
+        self.cache_size = cache_size
+        self._cards = OrderedDict()
+        # the http server answers from several threads
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.lemmes_served = 0
+        self.hits = 0
+        self.misses = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._busy_seconds = 0.0
+        self._started = time.time()
+
+    def __contains__(self, lemme):
+        return lemme in self._reader
+
+    def __len__(self):
+        return len(self._reader)
+
+    def close(self):
+        self._reader.close()
+
+    def lookup(self, lemmes) -> dict:
+        """
+        {'cards': [...], 'missing': [...]} for lemmes (one or a list), cards in the order asked.
+        A lemme can have no card (e.g. quelques) or several (le tour / la tour).
+        """
+        if isinstance(lemmes, str):
+            lemmes = [lemmes]
+
+        started = time.perf_counter()
+        cards = []
+        with self._lock:
+            lemmes = list(dict.fromkeys(lemmes))
+            found = [lemme for lemme in lemmes if lemme in self._reader]
+            missing = [lemme for lemme in lemmes if lemme not in self._reader]
+
+            # the LRU's cards are taken before the new ones go in, putting those in can evict them.
+            # every lemme not in the LRU is read and formatted in one go
+            cached = {lemme: self._cached_cards(lemme) for lemme in found if lemme in self._cards}
+            made = self._make_cards([lemme for lemme in found if lemme not in cached])
+            for lemme in found:
+                cards.extend(cached[lemme] if lemme in cached else made[lemme])
+
+            seconds = time.perf_counter() - started
+            self.requests += 1
+            self.lemmes_served += len(found)
+            self._latencies.append(seconds)
+            self._busy_seconds += seconds
+        return {'cards': cards, 'missing': missing}
+
+    def _cached_cards(self, lemme) -> list:
+        self._cards.move_to_end(lemme)
+        self.hits += 1
+        return self._cards[lemme]
+
+    def _make_cards(self, lemmes) -> dict:
+        """lemme -> cards for lemmes, out of one read of their rows. Each one goes into the LRU."""
+        if not lemmes:
+            return {}
+        self.misses += len(lemmes)
+
+        # only what format_lemme() looks at, all text (a handful of rows can look numeric where the whole file
+        # wouldn't). they come back lemme by lemme in the order asked, a row per line of the lemme's in the file
+        columns = self._format.FORMAT_COLUMNS
+        df = self._reader.rows(lemmes, usecols=columns, dtype=dict.fromkeys(columns, object))
+        rows = self._format.to_lex_rows(df)
+        ends = np.cumsum([self._reader.raw(lemme).count(b'\n') for lemme in lemmes])
+        # every lemme's pronunciation in one pass, like format_decks(). no orthosyll is an empty one, like in
+        # the decks (and NaN isn't json). a lemme read_csv() turned into NaN (nan, null, ...) isn't in there either
+        spoken = pronunciations(df).fillna('')
+
+        made = {}
+        for lemme, header, start, end in zip(lemmes, tpl.bold_headers(lemmes), np.append(0, ends[:-1]), ends):
+            export_rows, _, _, _ = self._format.format_lemme(lemme, rows[start:end], header, None,
+                                                             spoken.get(lemme, ''))
+            made[lemme] = [{field: row[field] for field in CARD_FIELDS} for row in export_rows]
+
+            self._cards[lemme] = made[lemme]
+            if len(self._cards) > self.cache_size:
+                self._cards.popitem(last=False)
+        return made
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            uptime = time.time() - self._started
+            return {'lemmes_indexed': len(self._reader),
+                    'load_ms': round(self.load_seconds * 1000, 1),
+                    'requests': self.requests,
+                    'lemmes_served': self.lemmes_served,
+                    'cache_hits': self.hits,
+                    'cache_misses': self.misses,
+                    'cache_size': len(self._cards),
+                    'p50_ms': round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+                    'p99_ms': round(float(np.percentile(latencies, 99)), 3) if len(latencies) else None,
+                    # per second of time spent answering, and per second since startup
+                    'lemmes_per_busy_second': round(self.lemmes_served / self._busy_seconds, 1)
+                                              if self._busy_seconds else None,
+                    'requests_per_second': round(self.requests / uptime, 3) if uptime else None,
+                    'uptime_seconds': round(uptime, 1)}
+
+
+def make_handler(service):
+    class LookupHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/stats':
+                self.send_json(200, service.stats())
+            elif url.path == '/cards':
+                query = parse_qs(url.query)
+                lemmes = query.get('lemme', []) + [lemme for value in query.get('lemmes', [])
+                                                   for lemme in value.split(',') if lemme]
+                self.send_json(200, service.lookup(lemmes))
+            else:
+                self.send_json(404, {'error': f'no such path {url.path}, try /cards or /stats'})
+
+        def do_POST(self):
+            if urlparse(self.path).path != '/cards':
+                self.send_json(404, {'error': 'POST /cards only'})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+                lemmes = body['lemmes']
+                if not isinstance(lemmes, list) or not all(isinstance(lemme, str) for lemme in lemmes):
+                    raise ValueError('lemmes has to be a list of strings')
+            except (KeyError, TypeError, ValueError) as e:
+                self.send_json(400, {'error': f'expected {{"lemmes": [...]}}: {e}'})
+                return
+            self.send_json(200, service.lookup(lemmes))
+
+        def send_json(self, status, payload):
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass  # a line per request would cost more than the lookup
+
+    return LookupHandler
+
+
+def serve(service, host='127.0.0.1', port=DEFAULT_PORT):
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f'Serving {len(service)} lemmes on http://{host}:{port}/cards (Ctrl+C to stop)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(service.stats(), indent=1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Look up cards for single lemmes, or serve them over HTTP.')
+    parser.add_argument('lemmes', nargs='*')
+    parser.add_argument('--csv', help="filtered lexique, stage 1's output by default")
+    parser.add_argument('--serve', action='store_true')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    service = LookupService(args.csv)
+    print(f'Indexed {len(service)} lemmes in {service.load_seconds * 1000:.0f} ms')
+
+    if args.lemmes:
+        found = service.lookup(args.lemmes)
+        for card in found['cards']:
+            print('\t'.join(str(card[field]) for field in CARD_FIELDS))
+        if found['missing']:
+            print(f'Not found: {", ".join(found["missing"])}')
+
+    if args.serve:
+        serve(service, args.host, args.port)
+    service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+Byte offsets of every lemme's rows in a .csv, so a few lemmes can be read without parsing the whole file.
+
+Stage 1's filtered lexique (and stage 2's chunks) keep each lemme's rows together, so a lemme is one byte
+range. The index sits next to the .csv:
+    Lexique383 - Filtered.csv -> Lexique383 - Filtered.csv.offsets.json
+holding the header's range and every lemme's start and end, plus the .csv's size and mtime. A stale or missing
+index is rebuilt the first time OffsetReader opens the .csv.
+
+    with OffsetReader('Lexique383 - Filtered.csv') as reader:
+        df = reader.rows(['maison', 'chat'])   # only those rows get parsed, straight out of the mmap
+
+    python offset_index.py "Lexique383 - Filtered.csv" maison chat
+prints the rows and how long the lookup took.
+
+Fields spanning several lines aren't supported, nothing in the lexique has one.
+"""
+import argparse
+import io
+import json
+import mmap
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+INDEX_EXT = '.offsets.json'
+INDEX_VERSION = 1
+
+
+def index_path(csv_path) -> str:
+    return f'{csv_path}{INDEX_EXT}'
+
+
+def build_offset_index(csv_path, column='lemme') -> dict:
+    """Scan csv_path once and write its offset index. Returns the index."""
+    lemmes = pd.read_csv(csv_path, usecols=[column], dtype=str, keep_default_na=False)[column].to_numpy()
+
+    with open(csv_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                newlines = np.flatnonzero(np.frombuffer(mm, dtype=np.uint8) == ord('\n'))
+        else:
+            newlines = np.empty(0, dtype=np.int64)
+
+    # where every line starts, the last one ending at the end of the file
+    starts = np.concatenate(([0], newlines + 1))
+    if starts[-1] == size:
+        starts = starts[:-1]
+    ends = np.append(starts[1:], size)
+    if len(starts) != len(lemmes) + 1:
+        raise ValueError(f'{csv_path} has {len(starts) - 1} lines but {len(lemmes)} rows, '
+                         f'fields spanning lines can\'t be indexed')
+
+    # rows 1.. are the data. a new run starts wherever the lemme changes
+    row_starts, row_ends = starts[1:], ends[1:]
+    run_starts = np.flatnonzero(np.concatenate(([len(lemmes) > 0], lemmes[1:] != lemmes[:-1])))
+    run_ends = np.append(run_starts[1:], len(lemmes))[:len(run_starts)] - 1
+
+    run_lemmes = pd.Series(lemmes[run_starts], dtype=object)
+    split = run_lemmes[run_lemmes.duplicated()]
+    if len(split):
+        raise ValueError(f'{csv_path} isn\'t grouped by {column}: "{split.iloc[0]}" shows up in more than one place')
+
+    stat = os.stat(csv_path)
+    index = {'version': INDEX_VERSION,
+             'column': column,
+             'source_size': stat.st_size,
+             'source_mtime_ns': stat.st_mtime_ns,
+             'header': [int(starts[0]), int(ends[0])],
+             # parallel lists load a good deal faster than a dict of pairs
+             'lemmes': run_lemmes.tolist(),
+             'starts': row_starts[run_starts].tolist(),
+             'ends': row_ends[run_ends].tolist()}
+
+    # write then rename so a reader never sees half an index
+    tmp_path = f'{index_path(csv_path)}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, index_path(csv_path))
+    return index
+
+
+def load_offset_index(csv_path, column='lemme') -> dict:
+    """The .csv's offset index, rebuilt first if it's missing or older than the .csv."""
+    path = index_path(csv_path)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            index = json.load(f)
+        stat = os.stat(csv_path)
+        if (index.get('version') == INDEX_VERSION and index.get('column') == column
+                and index.get('source_size') == stat.st_size and index.get('source_mtime_ns') == stat.st_mtime_ns):
+            return index
+    return build_offset_index(csv_path, column)
+
+
+class OffsetReader:
+    """Reads single lemmes' rows out of a memory-mapped .csv using its offset index."""
+    def __init__(self, csv_path, column='lemme'):
+        self.csv_path = csv_path
+        index = load_offset_index(csv_path, column)
+        # lemme -> (start, end)
+        self.offsets = dict(zip(index['lemmes'], zip(index['starts'], index['ends'])))
+
+        self._file = open(csv_path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if index['header'][1] else b''
+        start, end = index['header']
+        self.header = self._mm[start:end].rstrip(b'\r\n') + b'\n'
+
+    def __contains__(self, lemme):
+        return lemme in self.offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def lemmes(self) -> list:
+        """Every lemme in file order."""
+        return list(self.offsets)
+
+    def raw(self, lemme) -> bytes:
+        """The lemme's lines as they are in the file, b'' if it isn't there."""
+        if lemme not in self.offsets:
+            return b''
+        start, end = self.offsets[lemme]
+        lines = self._mm[start:end]
+        return lines if lines.endswith(b'\n') else lines + b'\n'
+
+    def rows(self, lemmes, **read_csv_kwargs) -> pd.DataFrame:
+        """
+        DataFrame of every row for lemmes (one lemme or a list), lemme by lemme in the order asked.
+        Lemmes not in the file are skipped. read_csv_kwargs go to pd.read_csv (dtype, keep_default_na, ...).
+        """
+        if isinstance(lemmes, str):
+            lemmes = [lemmes]
+        body = b''.join(self.raw(lemme) for lemme in dict.fromkeys(lemmes))
+        return pd.read_csv(io.BytesIO(self.header + body), **read_csv_kwargs)
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print some lemmes\' rows from an indexed .csv.')
+    parser.add_argument('csv_path')
+    parser.add_argument('lemmes', nargs='+')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with OffsetReader(args.csv_path) as reader:
+        opened = time.perf_counter()
+        df = reader.rows(args.lemmes)
+        done = time.perf_counter()
+        missing = [lemme for lemme in args.lemmes if lemme not in reader]
+
+    print(df.to_string(index=False))
+    if missing:
+        print(f'Not found: {", ".join(missing)}')
+    print(f'\nIndex loaded in {(opened - started) * 1000:.1f} ms, rows read in {(done - opened) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
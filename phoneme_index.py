@@ -0,0 +1,44 @@
+"""
+Lookup by pronunciation (the lexique's phon column), for sharing one audio clip between every
+lemme that sounds the same: vert / verre / ver / vers, ...
+
+A lemme is pronounced as its own form, i.e. the phon of its first row with ortho == lemme, or its
+first row if it has no such row (pronunciation.py's rule, which stage 3 takes 'Pronunciation' by too).
+"""
+import pandas as pd
+
+from pronunciation import pronunciations
+
+
+class PhonemeIndex:
+    def __init__(self, df):
+        """df needs ortho, lemme and phon columns. Rows without a phon are left out."""
+        df = df[['ortho', 'lemme', 'phon']].astype(object)
+        df = df[df['phon'].notna() & (df['phon'] != '')]
+
+        # phon -> every lemme / form spelled with it
+        self.lemmes = df.groupby('phon', sort=False)['lemme'].agg(set).to_dict()
+        self.forms = df.groupby('phon', sort=False)['ortho'].agg(set).to_dict()
+
+        # lemme -> its pronunciation, out of the rows that have a phon
+        self.phon_of = pronunciations(df, 'phon').to_dict()
+
+    @classmethod
+    def from_csvs(cls, paths):
+        """Index over several 'Freq X - Y.csv' chunks. Chunks from before phon was kept just index nothing."""
+        frames = [pd.read_csv(path, dtype=str, keep_default_na=False) for path in paths]
+        frames = [frame for frame in frames if 'phon' in frame.columns]
+        if not frames:
+            return cls(pd.DataFrame(columns=['ortho', 'lemme', 'phon']))
+        return cls(pd.concat(frames, ignore_index=True))
+
+    def group_by_sound(self, lemmes) -> list:
+        """
+        Split lemmes into lists that share a pronunciation, first-seen order kept.
+        Lemmes without a known phon get a list to themselves.
+        """
+        groups = {}
+        for lemme in dict.fromkeys(lemmes):
+            phon = self.phon_of.get(lemme)
+            groups.setdefault(lemme if phon is None else ('phon', phon), []).append(lemme)
+        return list(groups.values())
@@ -0,0 +1,34 @@
+"""
+Which row a lemme is pronounced from: its first row whose ortho is the lemme itself, or its first row
+if it has none. Stage 3's 'Pronunciation' (orthosyll), the lookup service's cards and phoneme_index.py's
+phon all go by it.
+
+Picked for every lemme of a frame in one pass instead of scanning each lemme's rows:
+the first matching row per lemme, with each lemme's first row filling in where there's no match.
+"""
+import numpy as np
+import pandas as pd
+
+from lexique_schema import first_seen_codes
+
+
+def pronunciation_rows(df, lemme_column='lemme') -> pd.Series:
+    """Position in df of every lemme's pronunciation row, indexed by lemme in first-seen order."""
+    codes, uniques = first_seen_codes(df[lemme_column])
+
+    # each lemme's first row. codes number lemmes as first seen, so every code is there and in order
+    rows = np.unique(codes, return_index=True)[1]
+
+    # first row per lemme whose ortho is the lemme, put over the first rows
+    is_form = df['ortho'].to_numpy(dtype=object) == np.asarray(uniques, dtype=object)[codes]
+    form_rows = np.flatnonzero(is_form)
+    matched, first = np.unique(codes[form_rows], return_index=True)
+    rows[matched] = form_rows[first]
+
+    return pd.Series(rows, index=pd.Index(uniques, dtype=object), name='row')
+
+
+def pronunciations(df, column='orthosyll', lemme_column='lemme') -> pd.Series:
+    """Every lemme's column value from its pronunciation row, indexed by lemme in first-seen order."""
+    rows = pronunciation_rows(df, lemme_column)
+    return pd.Series(df[column].to_numpy(dtype=object)[rows.to_numpy()], index=rows.index, name=column)
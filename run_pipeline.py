@@ -0,0 +1,143 @@
+"""
+Run all three stages in one process: filter the lexique, chunk it, format every chunk into an Anki deck.
+
+DataFrames are handed straight from one stage to the next instead of going through .csv files, and every
+chunk gets its deck in the same run (no editing INPUT_CSV and re-running stage 3 per chunk).
+Paths and settings still come from each stage's configuration section.
+Files whose inputs didn't change since the last run are skipped, see build_manifest.py.
+
+Usage:
+    python run_pipeline.py                  # only writes the anki_deck_X-Y.csv files
+    python run_pipeline.py --checkpoint     # also writes Lexique383 - Filtered.csv and the Freq X - Y.csv files
+                                            # (or stage 2's DATASET_PATH instead of the Freq files)
+    python run_pipeline.py --audio          # then fills the decks' Sound fields (stage 4, needs aiohttp)
+    python run_pipeline.py --apkg           # and packs the decks and audio into one .apkg (stage 5)
+    python run_pipeline.py --report r.json  # timings, peak memory, row counts and formatting failures as JSON
+"""
+import argparse
+import os
+import time
+from collections import Counter
+
+from build_manifest import BuildManifest
+from instrumentation import Instruments, section
+from offset_index import build_offset_index, load_offset_index
+from phoneme_index import PhonemeIndex
+from snapshot_cache import snapshot_key
+from stages import load_stage
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the lexique -> Anki pipeline in one process.')
+    parser.add_argument('--checkpoint', action='store_true',
+                        help='also write the intermediate filtered lexique and chunk .csv files')
+    parser.add_argument('--audio', action='store_true',
+                        help="fetch pronunciation audio into the decks' Sound fields")
+    parser.add_argument('--apkg', action='store_true',
+                        help='write every deck into one Anki package')
+    parser.add_argument('--report', metavar='PATH',
+                        help='write a JSON report of per-step timings, peak memory, row counts and formatting '
+                             'failures (which then aren\'t printed). Tracing memory slows the run down')
+    args = parser.parse_args()
+
+    lexique_filter = load_stage(1)
+    make_little_csvs = load_stage(2)
+    anki_format = load_stage(3)
+
+    timings = {}
+    instruments = Instruments(trace_memory=True) if args.report else None
+
+    # === STAGE 1: FILTER
+    started = time.perf_counter()
+    rule_hits = Counter()
+    with section(instruments, 'stage1.filter') as s:
+        df = lexique_filter.filter_lexique(rule_hits, instruments)
+        s['rows_out'] = len(df)
+    if args.checkpoint:
+        manifest = BuildManifest(os.path.dirname(lexique_filter.output_file_path))
+        lexique_hash = snapshot_key(lexique_filter.input_file_path, lexique_filter.filter_config())
+        if not manifest.is_current(lexique_filter.output_file_path, lexique_hash):
+            df.to_csv(lexique_filter.output_file_path, index=False, encoding='utf-8')
+            manifest.record(lexique_filter.output_file_path, lexique_hash)
+            print(f'Wrote clean .csv file saved to: {lexique_filter.output_file_path}')
+            build_offset_index(lexique_filter.output_file_path)
+        else:
+            load_offset_index(lexique_filter.output_file_path)  # (re)builds the index if it's missing
+    timings['filter'] = time.perf_counter() - started
+
+    # === STAGE 2: CHUNK
+    started = time.perf_counter()
+    spoken_counts = []
+    with section(instruments, 'stage2.chunk', rows_in=len(df)) as s:
+        df = make_little_csvs.clean_input(df)
+        chunks = list(make_little_csvs.make_chunks(df, instruments, spoken_counts))
+        s['rows_out'] = sum(len(chunk_df) for _, _, chunk_df in chunks)
+    if args.checkpoint:
+        os.makedirs(make_little_csvs.OUTPUT_FOLDER, exist_ok=True)
+        manifest = BuildManifest(make_little_csvs.OUTPUT_FOLDER)
+        with section(instruments, 'stage2.write_chunks'):
+            if make_little_csvs.DATASET_PATH:
+                make_little_csvs.write_chunk_dataset(chunks, spoken_counts, manifest)
+            else:
+                make_little_csvs.write_chunks(chunks, manifest)
+    timings['chunk'] = time.perf_counter() - started
+
+    # === STAGE 3: ANKI FORMAT
+    started = time.perf_counter()
+    os.makedirs(anki_format.OUTPUT_DIR, exist_ok=True)
+    manifest = BuildManifest(anki_format.OUTPUT_DIR)
+    deck_files = []
+    cache = anki_format.open_declension_cache()
+    with section(instruments, 'stage3.format', rows_in=len(df)) as s, anki_format.worker_pool() as pool:
+        for chunk_start, _, chunk_df in chunks:
+            for start_idx, end_idx, export_df in anki_format.format_decks(chunk_df, chunk_start, pool, manifest,
+                                                                          cache, instruments):
+                if export_df is not None:
+                    with section(instruments, 'write_deck', rows_in=len(export_df)):
+                        anki_format.write_deck(start_idx, end_idx, export_df)
+                deck_files.append(anki_format.deck_path(start_idx, end_idx))
+        s['rows_out'] = len(deck_files)
+    cache.close()
+    timings['format'] = time.perf_counter() - started
+
+    # === STAGE 4: AUDIO
+    if args.audio:
+        started = time.perf_counter()
+        with section(instruments, 'stage4.audio', rows_in=len(deck_files)):
+            load_stage(4).fill_sound_fields(deck_files, PhonemeIndex(df))
+        timings['audio'] = time.perf_counter() - started
+
+    # last so it has the Sound fields too
+    if anki_format.COMBINED_DECK:
+        with section(instruments, 'write_combined_deck', rows_in=len(deck_files)):
+            anki_format.write_combined_deck(deck_files)
+
+    # === STAGE 5: PACKAGE
+    if args.apkg:
+        started = time.perf_counter()
+        with section(instruments, 'stage5.apkg', rows_in=len(deck_files)):
+            load_stage(5).build_package(deck_files)
+        timings['apkg'] = time.perf_counter() - started
+
+    print_timings(timings)
+
+    if instruments is not None:
+        # empty when stage 1 came from its snapshot
+        for rule, hits in rule_hits.items():
+            instruments.count('filter_rules', rule, hits)
+        instruments.count('declension_cache', 'hits', cache.hits)
+        instruments.count('declension_cache', 'misses', cache.misses)
+        instruments.write(args.report)
+        instruments.close()
+        print(f'\n{len(instruments.failures)} formatting exceptions, report written to {args.report}')
+
+
+def print_timings(timings):
+    print('\nStage timings:')
+    for stage, seconds in timings.items():
+        print(f'\t{stage:<8}{seconds:8.2f}s')
+    print(f'\t{"total":<8}{sum(timings.values()):8.2f}s')
+
+
+if __name__ == '__main__':
+    main()
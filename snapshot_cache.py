@@ -0,0 +1,63 @@
+"""
+Binary snapshots of parsed .csv files so re-runs don't have to parse text again.
+
+A snapshot is a Feather file saved next to the .csv it came from, one per reader of the .csv:
+    Lexique383.csv -> Lexique383.csv.<reader>.<key>.feather
+
+The key is a hash of the .csv contents plus the stage config that shaped the parsed frame, so
+editing the source file or tweaking the config (desired_POS, CHUNK_SIZE, ...) rebuilds it and
+anything else is memory-mapped straight back in.
+
+Needs pyarrow. Without it load_cached() just calls build() every time.
+"""
+import glob
+import hashlib
+import json
+import os
+
+try:
+    from pyarrow import feather
+except ImportError:
+    feather = None
+
+SNAPSHOT_EXT = '.feather'
+KEY_LENGTH = 16
+
+
+def load_cached(source_path, config, build, reader):
+    """
+    Return the frame build() makes from source_path, going through a snapshot when one matches.
+    config is anything json-serialisable that changes what build() returns. reader names who's asking
+    ('stage2', ...): two readers parsing the same .csv keep a snapshot each instead of replacing each other's.
+    """
+    if feather is None:
+        return build()
+
+    snapshot_path = f'{source_path}.{reader}.{snapshot_key(source_path, config)}{SNAPSHOT_EXT}'
+    if os.path.exists(snapshot_path):
+        return feather.read_table(snapshot_path, memory_map=True).to_pandas()
+
+    df = build()
+
+    # only ever keep a reader's newest snapshot for a file
+    remove_snapshots(source_path, reader)
+    feather.write_feather(df.reset_index(drop=True), snapshot_path)
+
+    return df
+
+
+def snapshot_key(source_path, config) -> str:
+    digest = hashlib.sha256()
+    with open(source_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    digest.update(json.dumps(config, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()[:KEY_LENGTH]
+
+
+def remove_snapshots(source_path, reader):
+    source = glob.escape(source_path)
+    # along with any from before snapshots were per reader (<source>.<key>.feather)
+    patterns = [f'{source}.{glob.escape(reader)}.*{SNAPSHOT_EXT}', f'{source}.{"[0-9a-f]" * KEY_LENGTH}{SNAPSHOT_EXT}']
+    for path in [path for pattern in patterns for path in glob.glob(pattern)]:
+        os.remove(path)
@@ -0,0 +1,34 @@
+"""
+Import the numbered stage scripts as modules.
+
+The scripts' file names have spaces so a plain import won't work. Loading one doesn't run it,
+everything sits behind `if __name__ == '__main__'`.
+"""
+import importlib.util
+import os
+import sys
+
+STAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# stage number -> (module name, script file)
+STAGE_FILES = {
+    1: ('lexique_filter', '1. Initial Lexique Filter.py'),
+    2: ('make_little_csvs', '2. Make Little CSVs.py'),
+    3: ('anki_import_format', '3. Little CSV to Anki Import Format.py'),
+    4: ('fetch_audio', '4. Fetch Pronunciation Audio.py'),
+    5: ('anki_package', '5. Build Anki Package.py'),
+}
+
+
+def load_stage(number):
+    module_name, file_name = STAGE_FILES[number]
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(STAGE_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+
+    # registered before running so worker processes and pickle can find it by name
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
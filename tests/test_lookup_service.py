@@ -0,0 +1,100 @@
+"""
+The lookup service against stage 3's decks, on a small synthetic lexique (see benchmarks/synthetic_lexique.py).
+
+    python -m pytest tests
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from lookup_service import CARD_FIELDS, LookupService  # noqa: E402
+from stages import load_stage  # noqa: E402
+from synthetic_lexique import make_lexique  # noqa: E402
+
+N_ROWS = 6000
+NO_ORTHOSYLL = 20  # lemmes whose rows get no orthosyll, they're '' in the decks
+
+
+@pytest.fixture(scope='module')
+def filtered_csv(tmp_path_factory):
+    """Stage 1's filtered .csv of the synthetic lexique."""
+    tmp_dir = tmp_path_factory.mktemp('lexique')
+    lexique = make_lexique(N_ROWS, seed=1)
+    lexique.loc[lexique['3_lemme'].isin(lexique['3_lemme'].unique()[:NO_ORTHOSYLL]), '28_orthosyll'] = None
+    lexique_path = tmp_dir / 'Lexique383.csv'
+    lexique.to_csv(lexique_path, index=False, encoding='utf-8')
+
+    lexique_filter = load_stage(1)
+    df = lexique_filter.filter_df_for_highest_pos(lexique_filter.read_lexique(str(lexique_path)))
+    csv_path = tmp_dir / 'Lexique383 - Filtered.csv'
+    df.to_csv(csv_path, index=False, encoding='utf-8')
+    return str(csv_path)
+
+
+@pytest.fixture(scope='module')
+def deck(filtered_csv):
+    """Every deck stage 2 and 3 make out of the filtered .csv, as one frame."""
+    make_little_csvs, anki_format = load_stage(2), load_stage(3)
+    df = make_little_csvs.clean_input(pd.read_csv(filtered_csv))
+    export_dfs = []
+    # format_decks prints its formatting failures
+    with contextlib.redirect_stdout(io.StringIO()):
+        for start_idx, _, chunk_df in make_little_csvs.make_chunks(df):
+            export_dfs.extend(export_df for _, _, export_df in anki_format.format_decks(chunk_df, start_idx))
+    # what the deck .csv files hold
+    return pd.concat(export_dfs, ignore_index=True)[CARD_FIELDS].fillna('').astype(str)
+
+
+def test_cards_match_decks(filtered_csv, deck, monkeypatch):
+    service = LookupService(filtered_csv, cache_size=50)
+
+    # pronunciations come from pronunciation.py's one pass, not format_lemme() scanning each lemme's rows
+    format_lemme = service._format.format_lemme
+    passed = []
+
+    def format_lemme_spy(lemme, lex_rows, header=None, declension=None, pronunciation=None):
+        passed.append(pronunciation)
+        return format_lemme(lemme, lex_rows, header, declension, pronunciation)
+
+    monkeypatch.setattr(service._format, 'format_lemme', format_lemme_spy)
+
+    lemmes = list(dict.fromkeys(deck['Lemme']))
+    for i in range(0, len(lemmes), 37):
+        batch = lemmes[i:i + 37]
+        found = service.lookup(batch + batch[:3] + ['not a lemme'])
+        json.dumps(found, allow_nan=False)
+
+        cards = pd.DataFrame(found['cards'], columns=CARD_FIELDS).astype(str)
+        expected = pd.concat([deck[deck['Lemme'] == lemme] for lemme in batch], ignore_index=True)
+        pd.testing.assert_frame_equal(cards, expected)
+        assert found['missing'] == ['not a lemme']
+
+    assert (deck['Pronunciation'] == '').any()
+    assert len(passed) == len(lemmes) and None not in passed
+    assert service.stats()['lemmes_served'] == len(lemmes)
+    service.close()
+
+
+def test_small_cache_evicting_lemmes_of_the_same_request(filtered_csv):
+    service = LookupService(filtered_csv, cache_size=2)
+    l0, l1, l2, l3 = service._reader.lemmes[:4]
+    l0_cards = [card for card in service.lookup([l0, l1])['cards'] if card['Lemme'] == l0]
+
+    # l0 comes out of the LRU, then making l2 and l3 evicts it while the request is still being answered
+    second = service.lookup([l0, l2, l3])
+    assert [card for card in second['cards'] if card['Lemme'] == l0] == l0_cards
+    assert len(service._cards) == 2
+
+    # and it's made again once it's gone
+    assert service.lookup([l0])['cards'] == l0_cards
+    assert (service.hits, service.misses) == (1, 5)
+    service.close()